@@ -1,10 +1,54 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+"""
+REST API for nutrition logging and summaries, on the same async DB layer as the MCP server.
+
+    SHARED_STATE=db uvicorn api_server:app --host 0.0.0.0 --port 8000 --workers 4
+
+With more than one worker, SHARED_STATE=db keeps the Gemini rate limit and trend cache
+correct across processes (see nutrition_tracker/shared_state.py).
+"""
+from contextlib import asynccontextmanager
 from datetime import date
-from nutrition_tracker.tracker import get_nutrition_from_gemini
-from nutrition_tracker.db import log_food, get_daily_summary
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import text
+
+from nutrition_tracker.db import get_engine, get_pool_status
+from nutrition_tracker.tracker import (
+    get_nutrition_cached, get_nutrition_batch, get_nutrition_totals_from_db, GeminiConfigError,
+)
+from nutrition_tracker.history import export_history, check_format, MEDIA_TYPES
+from nutrition_tracker.analytics import get_nutrition_trends
+from nutrition_tracker.write_behind import write_behind, log_nutrition, log_nutrition_batch, LOG_WRITE_BEHIND
+from nutrition_tracker.metrics import trace, render, CONTENT_TYPE
+from nutrition_tracker.normalize import NUTRIENT_KEYS
+
+MAX_BATCH_ITEMS = 50
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if LOG_WRITE_BEHIND:
+        await write_behind.start()
+    yield
+    await write_behind.stop()
+    # Close pooled DB connections so a rolling restart behind the load balancer is clean.
+    await get_engine().dispose()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    with trace("http", request.method) as t:
+        try:
+            return await call_next(request)
+        finally:
+            # Label by route template (/users/{user_id}/...) rather than the concrete path.
+            route = request.scope.get("route")
+            t.name = f"{request.method} {route.path if route else 'unmatched'}"
 
 class LogFoodRequest(BaseModel):
     user_id: str
@@ -29,15 +73,125 @@ class SummaryResponse(BaseModel):
     carbs: float
     fat: float
 
+class DailySummary(SummaryResponse):
+    date: date
+
+class FoodAmount(BaseModel):
+    food: str
+    amount: float
+
+class LogFoodBatchRequest(BaseModel):
+    user_id: str
+    items: List[FoodAmount] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class LogFoodBatchItem(BaseModel):
+    food: str
+    amount: float
+    logged: bool
+    calories: Optional[float] = None
+    protein: Optional[float] = None
+    carbs: Optional[float] = None
+    fat: Optional[float] = None
+    error: Optional[str] = None
+
+class LogFoodBatchResponse(BaseModel):
+    items: List[LogFoodBatchItem]
+    total: SummaryResponse
+
+
+def _zero_summary() -> dict:
+    return {k: 0.0 for k in NUTRIENT_KEYS}
+
+
+@app.get("/health")
+async def health():
+    try:
+        async with get_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        print(f"Health check DB error: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ok", "pool": get_pool_status(), "write_behind": write_behind.get_stats()}
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
+
 @app.post("/log_food", response_model=LogFoodResponse)
-def log_food_endpoint(req: LogFoodRequest):
-    nutrition = get_nutrition_from_gemini(req.food, req.amount)
+async def log_food_endpoint(req: LogFoodRequest):
+    try:
+        nutrition = await get_nutrition_cached(req.food, req.amount)
+    except GeminiConfigError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     if not nutrition:
         raise HTTPException(status_code=400, detail="Could not get nutrition info from Gemini.")
-    log_food(req.user_id, req.food, req.amount, nutrition)
+    await log_nutrition(req.user_id, req.food, req.amount, nutrition)
     return LogFoodResponse(food=req.food, amount=req.amount, **nutrition)
 
+@app.post("/log_food/batch", response_model=LogFoodBatchResponse)
+async def log_food_batch_endpoint(req: LogFoodBatchRequest):
+    """
+    Looks up every item with one batched Gemini call and logs the ones that resolved
+    (in a single transaction, or through the write-behind queue when it is on).
+    Items without nutrition info are reported, not logged.
+    """
+    try:
+        results = await get_nutrition_batch([(item.food, item.amount) for item in req.items])
+    except GeminiConfigError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not any(results):
+        raise HTTPException(status_code=400, detail="Could not get nutrition info for any of the items.")
+    await log_nutrition_batch(
+        req.user_id, [(item.food, item.amount, n) for item, n in zip(req.items, results) if n]
+    )
+    items, total = [], _zero_summary()
+    for item, nutrition in zip(req.items, results):
+        if nutrition is None:
+            items.append(LogFoodBatchItem(food=item.food, amount=item.amount, logged=False, error="Could not get nutrition info."))
+            continue
+        items.append(LogFoodBatchItem(food=item.food, amount=item.amount, logged=True, **nutrition))
+        for k in total:
+            total[k] += nutrition[k]
+    return LogFoodBatchResponse(items=items, total=SummaryResponse(**total))
+
 @app.post("/nutrition_summary", response_model=SummaryResponse)
-def nutrition_summary_endpoint(req: SummaryRequest):
-    summary = get_daily_summary(req.user_id, req.date)
-    return SummaryResponse(**summary)
+async def nutrition_summary_endpoint(req: SummaryRequest):
+    day = req.date.isoformat()
+    days = await get_nutrition_totals_from_db(req.user_id, day, day)
+    summary = days[0] if days else _zero_summary()
+    return SummaryResponse(**{k: summary[k] for k in NUTRIENT_KEYS})
+
+@app.get("/users/{user_id}/summary", response_model=List[DailySummary])
+async def range_summary_endpoint(user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """Per-day totals for the range (inclusive), one entry per day that has logs."""
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    return await get_nutrition_totals_from_db(
+        user_id, start_date.isoformat() if start_date else None, end_date.isoformat() if end_date else None
+    )
+
+@app.get("/users/{user_id}/trends")
+async def trends_endpoint(user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    try:
+        return await get_nutrition_trends(
+            user_id, start_date.isoformat() if start_date else None, end_date.isoformat() if end_date else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/users/{user_id}/history")
+async def export_history_endpoint(
+    user_id: str, format: str = "csv", start_date: Optional[date] = None, end_date: Optional[date] = None
+):
+    """Streams the user's whole nutrition log (or a date range) as CSV or NDJSON."""
+    try:
+        fmt = check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        export_history(
+            user_id, fmt, start_date.isoformat() if start_date else None, end_date.isoformat() if end_date else None
+        ),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="nutrition_history_{user_id}.{fmt}"'},
+    )
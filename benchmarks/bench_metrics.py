@@ -0,0 +1,53 @@
+"""
+Benchmark the tracing overhead.
+
+Reports the cost of an empty span, of a span inside an active trace, of a
+/metrics render, and of a traced vs untraced parse_nutrition call, so the
+instrumentation can be checked to stay cheap enough to leave on in production.
+
+    python benchmarks/bench_metrics.py [--repeat 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from nutrition_tracker import metrics
+from nutrition_tracker.metrics import span, trace, render
+from nutrition_tracker.parsing import parse_nutrition
+
+RESPONSE = '{"calories": 155, "protein": 13, "carbs": 1.1, "fat": 11}'
+
+
+def per_call_us(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def empty_span():
+    with span("bench", "empty"):
+        pass
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark tracing and metrics overhead.")
+    parser.add_argument("--repeat", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"span (no trace):        {per_call_us(empty_span, args.repeat):6.2f} us")
+    with trace("bench", "root") as t:
+        # Keep the trace's span list from growing without bound.
+        in_trace = per_call_us(lambda: (empty_span(), t.spans and t.spans.clear()), args.repeat)
+    print(f"span (inside trace):    {in_trace:6.2f} us")
+    print(f"parse_nutrition traced: {per_call_us(lambda: parse_nutrition(RESPONSE), args.repeat):6.2f} us")
+    print(f"parse_nutrition bare:   {per_call_us(lambda: parse_nutrition.__wrapped__(RESPONSE), args.repeat):6.2f} us")
+    print(f"render /metrics:        {per_call_us(render, 1000):6.0f} us ({len(metrics._histograms)} series)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Benchmark receipt preprocessing before OCR upload.
+
+For each sample image, compares the bytes sent to OCR and the end-to-end time
+with and without preprocessing (EXIF-rotate, grayscale, crop, downscale).
+
+End-to-end time uses the real OCR backend when VISION_KEY/VISION_ENDPOINT are
+set. Otherwise it is preprocessing time plus a simulated upload at --uplink-mbps
+and a simulated recognition time proportional to the pixel count.
+
+--phone-size also benchmarks each sample upscaled to a 12 MP, quality-95 JPEG,
+which is closer to what a phone camera sends over WhatsApp than a web sample.
+
+    python benchmarks/bench_ocr_preprocess.py [images...] [--phone-size] [--repeat 5]
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PIL import Image
+
+from nutrition_tracker.imaging import preprocess_receipt
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_IMAGES = [os.path.join(ROOT, "grocey.jpg")]
+PHONE_SIZE = (3024, 4032)
+# Rough cost of recognition per megapixel, for the simulated backend only.
+SIMULATED_SECONDS_PER_MEGAPIXEL = 0.15
+
+
+def phone_photo(image_bytes: bytes) -> bytes:
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = image.convert("RGB").resize(PHONE_SIZE, Image.BICUBIC)
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+
+def megapixels(image_bytes: bytes) -> float:
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return image.width * image.height / 1e6
+
+
+def simulated_ocr_seconds(image_bytes: bytes, uplink_mbps: float) -> float:
+    upload = len(image_bytes) * 8 / (uplink_mbps * 1e6)
+    return upload + megapixels(image_bytes) * SIMULATED_SECONDS_PER_MEGAPIXEL
+
+
+async def real_ocr_seconds(image_bytes: bytes) -> float:
+    from nutrition_tracker.ocr import read_text_lines
+    started = time.perf_counter()
+    await read_text_lines(image_bytes, preprocess=False)
+    return time.perf_counter() - started
+
+
+def measure(image_bytes: bytes, preprocess: bool, repeat: int, uplink_mbps: float, use_real: bool) -> dict:
+    prep_times, totals, sent = [], [], image_bytes
+    for _ in range(repeat):
+        started = time.perf_counter()
+        sent = preprocess_receipt(image_bytes) if preprocess else image_bytes
+        prep = time.perf_counter() - started
+        ocr = asyncio.run(real_ocr_seconds(sent)) if use_real else simulated_ocr_seconds(sent, uplink_mbps)
+        prep_times.append(prep)
+        totals.append(prep + ocr)
+    return {
+        "bytes": len(sent),
+        "megapixels": megapixels(sent),
+        "prep_ms": statistics.median(prep_times) * 1000,
+        "total_ms": statistics.median(totals) * 1000,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark receipt preprocessing before OCR upload.")
+    parser.add_argument("images", nargs="*", default=DEFAULT_IMAGES)
+    parser.add_argument("--phone-size", action="store_true", help="Also test 12 MP upscaled versions")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--uplink-mbps", type=float, default=4.0, help="Simulated upload bandwidth")
+    args = parser.parse_args()
+
+    use_real = bool(os.environ.get("VISION_KEY") and os.environ.get("VISION_ENDPOINT"))
+    print(f"OCR backend: {'real (VISION_ENDPOINT)' if use_real else f'simulated, {args.uplink_mbps} Mbps uplink'}")
+    print(f"{'sample':32} {'mode':5} {'bytes':>10} {'MP':>6} {'prep ms':>8} {'total ms':>9}")
+
+    for path in args.images:
+        with open(path, "rb") as f:
+            samples = [(os.path.basename(path), f.read())]
+        if args.phone_size:
+            samples.append((os.path.basename(path) + " @12MP", phone_photo(samples[0][1])))
+        for name, image_bytes in samples:
+            raw = measure(image_bytes, False, args.repeat, args.uplink_mbps, use_real)
+            pre = measure(image_bytes, True, args.repeat, args.uplink_mbps, use_real)
+            for mode, r in (("raw", raw), ("prep", pre)):
+                print(f"{name:32} {mode:5} {r['bytes']:>10} {r['megapixels']:>6.2f} {r['prep_ms']:>8.1f} {r['total_ms']:>9.1f}")
+            print(f"{'':32} bytes {pre['bytes'] / raw['bytes'] - 1:+.0%}, "
+                  f"end-to-end {pre['total_ms'] / raw['total_ms'] - 1:+.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
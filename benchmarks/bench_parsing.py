@@ -0,0 +1,144 @@
+"""
+Benchmark and check the Gemini response parser.
+
+Runs every raw response in fixtures/gemini_responses.json through the shared
+parser (nutrition_tracker.parsing) and through a copy of the inline parsers it
+replaced, and reports success rate and microseconds per parse for each. Exits
+non-zero if the shared parser gets any fixture wrong, so it doubles as a check.
+
+    python benchmarks/bench_parsing.py [--repeat 2000]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from nutrition_tracker.parsing import parse_nutrition, parse_nutrition_list, parse_string_list
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "gemini_responses.json")
+
+
+# --- Previous inline parsers, kept for comparison ---
+def legacy_nutrition_from_dict(data):
+    if not isinstance(data, dict):
+        raise ValueError("Nutrition entry is not a JSON object")
+    data = dict(data)
+    key_map = {
+        "protein (g)": "protein", "carbs (g)": "carbs", "fat (g)": "fat",
+        "protein_g": "protein", "carbs_g": "carbs", "fat_g": "fat",
+    }
+    for old, new in key_map.items():
+        if old in data:
+            data[new] = data.pop(old)
+    for key in ("calories", "protein", "carbs", "fat"):
+        if key not in data:
+            raise ValueError(f"Missing key: {key}")
+    return {k: float(data[k]) for k in ("calories", "protein", "carbs", "fat")}
+
+
+def legacy_parse_nutrition(text):
+    text = text.strip().lstrip("` \n")
+    if text.lower().startswith("json"):
+        text = text[4:].lstrip(" \n")
+    match = re.search(r'\{.*?\}', text, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON object found in Gemini response")
+    return legacy_nutrition_from_dict(json.loads(match.group(0)))
+
+
+def legacy_parse_batch(text, count):
+    text = text.strip().lstrip("` \n")
+    if text.lower().startswith("json"):
+        text = text[4:].lstrip(" \n")
+    match = re.search(r'\[.*\]', text, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON array found in Gemini response")
+    data = json.loads(match.group(0))
+    results = [None] * count
+    for position, entry in enumerate(data):
+        slot = int(entry.get("index", position + 1)) - 1
+        if 0 <= slot < count:
+            results[slot] = legacy_nutrition_from_dict(entry)
+    return results
+
+
+def legacy_parse_dishes(text):
+    text = text.strip().lstrip("` \n")
+    if text.lower().startswith("json"):
+        text = text[4:].lstrip(" \n")
+    match = re.search(r'\[.*\]', text, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON array found in Gemini response")
+    data = json.loads(match.group(0))
+    if not isinstance(data, list) or not all(isinstance(d, str) for d in data):
+        raise ValueError("Response is not a list of strings")
+    return data
+
+
+PARSERS = {
+    "shared": {
+        "nutrition": parse_nutrition,
+        "batch": parse_nutrition_list,
+        "dishes": parse_string_list,
+    },
+    "legacy": {
+        "nutrition": legacy_parse_nutrition,
+        "batch": legacy_parse_batch,
+        "dishes": legacy_parse_dishes,
+    },
+}
+
+
+def run(parser, fixture):
+    args = (fixture["text"], fixture["count"]) if fixture["kind"] == "batch" else (fixture["text"],)
+    return parser[fixture["kind"]](*args)
+
+
+def correct(parser, fixture) -> bool:
+    try:
+        return run(parser, fixture) == fixture["expect"]
+    except Exception:
+        return False
+
+
+def time_per_parse_us(parser, fixtures, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for fixture in fixtures:
+            try:
+                run(parser, fixture)
+            except Exception:
+                pass
+    return (time.perf_counter() - started) / (repeat * len(fixtures)) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Gemini response parser.")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--fixtures", default=FIXTURES)
+    args = parser.parse_args()
+
+    with open(args.fixtures, encoding="utf-8") as f:
+        fixtures = json.load(f)
+
+    ok = {name: [fx for fx in fixtures if correct(impl, fx)] for name, impl in PARSERS.items()}
+    # Timing only over responses both parsers handle, so failures (which bail out early) don't skew it.
+    common = [fx for fx in ok["shared"] if fx in ok["legacy"]]
+    failures = [fx["name"] for fx in fixtures if fx not in ok["shared"]]
+    print(f"{len(fixtures)} fixtures, {len(common)} parsed by both; timing over those")
+    print(f"{'parser':8} {'ok':>7} {'us/parse':>9}")
+    for name, impl in PARSERS.items():
+        per_parse = time_per_parse_us(impl, common, args.repeat) if common else 0.0
+        print(f"{name:8} {len(ok[name]):>3}/{len(fixtures):<3} {per_parse:>9.2f}")
+
+    for name in failures:
+        print(f"FAIL shared parser: {name}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
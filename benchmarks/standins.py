@@ -0,0 +1,100 @@
+"""
+Local stand-ins for Gemini and Azure Vision, for load tests.
+
+Selected on the server with GEMINI_BACKEND=standins:StandInGeminiModel and
+OCR_BACKEND=standins:StandInOcrBackend (with this directory on PYTHONPATH).
+Latency and error rates come from the environment:
+
+    STANDIN_GEMINI_LATENCY_MS (default 400), STANDIN_GEMINI_JITTER_MS (100),
+    STANDIN_GEMINI_ERROR_RATE (0.0; errors are 503s, which the client retries)
+    STANDIN_OCR_LATENCY_MS (1500), STANDIN_OCR_JITTER_MS (300), STANDIN_OCR_ERROR_RATE (0.0)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+GEMINI_LATENCY = float(os.environ.get("STANDIN_GEMINI_LATENCY_MS", 400)) / 1000
+GEMINI_JITTER = float(os.environ.get("STANDIN_GEMINI_JITTER_MS", 100)) / 1000
+GEMINI_ERROR_RATE = float(os.environ.get("STANDIN_GEMINI_ERROR_RATE", 0.0))
+OCR_LATENCY = float(os.environ.get("STANDIN_OCR_LATENCY_MS", 1500)) / 1000
+OCR_JITTER = float(os.environ.get("STANDIN_OCR_JITTER_MS", 300)) / 1000
+OCR_ERROR_RATE = float(os.environ.get("STANDIN_OCR_ERROR_RATE", 0.0))
+
+RECEIPT_LINES = ["FRESH MART", "Basmati Rice 5kg", "Toor Dal 1kg", "Paneer 200g", "Tomatoes", "Onions",
+                 "Qty 6", "Total Rs 1240"]
+_SINGLE_RE = re.compile(r"nutrition facts for (?P<amount>[\d.]+) (?P<food>.+?)\. Return", re.DOTALL)
+_BATCH_LINE_RE = re.compile(r"^(?P<index>\d+)\. (?P<amount>[\d.]+) (?P<food>.+)$", re.MULTILINE)
+
+
+class StandInError(Exception):
+    code = 503
+
+
+def _delay(latency: float, jitter: float) -> float:
+    return max(0.0, random.gauss(latency, jitter))
+
+
+def _nutrition(food: str, amount: float) -> Dict[str, float]:
+    """Deterministic per-food values, so repeated lookups agree like a real model mostly does."""
+    seed = int(hashlib.sha256(food.strip().lower().encode()).hexdigest()[:8], 16)
+    per_unit = {"calories": 40 + seed % 160, "protein": seed % 13, "carbs": seed % 31, "fat": seed % 11}
+    return {k: round(v * amount, 2) for k, v in per_unit.items()}
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StandInGeminiModel:
+    def __init__(self, model_name: str, generation_config: Optional[dict] = None):
+        self.model_name = model_name
+
+    def _answer(self, prompt: str) -> str:
+        if random.random() < GEMINI_ERROR_RATE:
+            raise StandInError("stand-in Gemini: service unavailable")
+        if "dish names" in prompt:
+            return json.dumps(["Stand-in Pulao", "Stand-in Curry", "Stand-in Salad"])
+        single = _SINGLE_RE.search(prompt)
+        if single:
+            return json.dumps(_nutrition(single["food"], float(single["amount"])))
+        return json.dumps([
+            {"index": int(m["index"]), **_nutrition(m["food"], float(m["amount"]))}
+            for m in _BATCH_LINE_RE.finditer(prompt)
+        ])
+
+    async def generate_content_async(self, prompt: str) -> _Response:
+        await asyncio.sleep(_delay(GEMINI_LATENCY, GEMINI_JITTER))
+        return _Response(self._answer(prompt))
+
+    def generate_content(self, prompt: str) -> _Response:
+        time.sleep(_delay(GEMINI_LATENCY, GEMINI_JITTER))
+        return _Response(self._answer(prompt))
+
+
+class StandInOcrBackend:
+    """Submit/poll like Azure Read: a job is 'running' until its simulated latency has passed."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Tuple[float, bool]] = {}
+
+    async def submit(self, image_bytes: bytes) -> str:
+        await asyncio.sleep(0.02)
+        operation_id = uuid.uuid4().hex
+        self._jobs[operation_id] = (time.monotonic() + _delay(OCR_LATENCY, OCR_JITTER), random.random() < OCR_ERROR_RATE)
+        return operation_id
+
+    async def poll(self, operation_id: str) -> Tuple[str, Optional[List[str]]]:
+        from nutrition_tracker.ocr import STATUS_RUNNING, STATUS_SUCCEEDED, STATUS_FAILED
+        await asyncio.sleep(0.01)
+        ready_at, failed = self._jobs[operation_id]
+        if time.monotonic() < ready_at:
+            return STATUS_RUNNING, None
+        del self._jobs[operation_id]
+        return (STATUS_FAILED, None) if failed else (STATUS_SUCCEEDED, list(RECEIPT_LINES))
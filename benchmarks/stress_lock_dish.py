@@ -0,0 +1,98 @@
+"""
+Concurrency stress check for log_nutrition_to_db (the lock_dish write path).
+With --write-behind the same logs go through the write-behind queue instead,
+and the timing includes draining the queue.
+
+Fires many concurrent logs for the same few users and then verifies that
+nutrition_totals and nutrition_daily equal the sum of what was logged, i.e.
+that no update was lost. Uses DATABASE_URL if set, otherwise a temporary
+SQLite file. Exits 1 on any lost update.
+
+    python benchmarks/stress_lock_dish.py [--users 3] [--logs 500] [--concurrency 20] [--write-behind]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "stress.sqlite3"))
+
+from sqlalchemy import select, func
+
+from nutrition_tracker.create_tables import create_all
+from nutrition_tracker.db import AsyncSessionLocal, get_engine
+from nutrition_tracker.models import User, NutritionLog, NutritionTotals, NutritionDaily
+from nutrition_tracker.tracker import log_nutrition_to_db
+from nutrition_tracker.write_behind import write_behind, log_nutrition
+
+NUTRITION = {"calories": 10.0, "protein": 1.0, "carbs": 2.0, "fat": 0.5}
+
+
+async def run(users: int, logs: int, concurrency: int, use_write_behind: bool = False) -> int:
+    get_engine().echo = False
+    await create_all()
+    log = log_nutrition if use_write_behind else log_nutrition_to_db
+    user_ids = [f"stress-{os.getpid()}-{u}" for u in range(users)]
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = []
+
+    async def one(i: int):
+        async with semaphore:
+            try:
+                await log(user_ids[i % users], "stress dish", 1, NUTRITION)
+            except Exception as e:
+                errors.append(e)
+
+    started = time.perf_counter()
+    if use_write_behind:
+        await write_behind.start()
+    await asyncio.gather(*(one(i) for i in range(logs)))
+    if use_write_behind:
+        await write_behind.stop()
+        print(f"write-behind: {write_behind.get_stats()}")
+    elapsed = time.perf_counter() - started
+
+    failures = 0
+    total_logged = 0
+    async with AsyncSessionLocal() as session:
+        for user_id in user_ids:
+            user = (await session.execute(select(User).where(User.user_id == user_id))).scalar_one()
+            logged = (await session.execute(
+                select(func.count(NutritionLog.id)).where(NutritionLog.user_id == user.id)
+            )).scalar_one()
+            totals = (await session.execute(
+                select(NutritionTotals).where(NutritionTotals.user_id == user.id)
+            )).scalar_one()
+            daily_kcal = (await session.execute(
+                select(func.sum(NutritionDaily.calories)).where(NutritionDaily.user_id == user.id)
+            )).scalar_one()
+            total_logged += logged
+            expected = logged * NUTRITION["calories"]
+            ok = abs(totals.calories - expected) < 1e-6 and abs((daily_kcal or 0) - expected) < 1e-6
+            failures += not ok
+            print(f"{user_id}: logs={logged} totals={totals.calories} daily={daily_kcal} expected={expected} {'OK' if ok else 'LOST UPDATES'}")
+
+    if total_logged != logs - len(errors):
+        failures += 1
+        print(f"LOST ENTRIES: {total_logged} rows for {logs - len(errors)} accepted logs")
+    print(f"{logs} logs in {elapsed:.2f}s ({logs / elapsed:.0f}/s), {len(errors)} errors")
+    for e in errors[:5]:
+        print(f"  error: {e!r}")
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--logs", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--write-behind", action="store_true", help="Log through the write-behind queue")
+    args = parser.parse_args()
+    return asyncio.run(run(args.users, args.logs, args.concurrency, args.write_behind))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,22 +11,37 @@ from datetime import date
 import ast
 import base64
 import io
+import signal
+import socket
 import time
 
 # --- Third-Party Imports ---
+import uvicorn
 from dotenv import load_dotenv
 from fastmcp import FastMCP
 from fastmcp.server.auth.providers.bearer import BearerAuthProvider, RSAKeyPair
+from fastmcp.server.middleware import Middleware
 from mcp import ErrorData, McpError
 from mcp.server.auth.provider import AccessToken
 from mcp.types import INVALID_PARAMS, INTERNAL_ERROR
 from pydantic import BaseModel, Field
-from azure.cognitiveservices.vision.computervision import ComputerVisionClient
-from azure.cognitiveservices.vision.computervision.models import OperationStatusCodes
-from msrest.authentication import CognitiveServicesCredentials
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
 
 # --- Local Imports ---
-from nutrition_tracker.tracker import get_nutrition_from_gemini, suggest_dishes_from_gemini
+from nutrition_tracker.tracker import get_nutrition_cached, get_nutrition_batch, suggest_dishes_cached, nutrition_flight, GeminiConfigError
+from nutrition_tracker.dish_cache import dish_cache
+from nutrition_tracker.cache import nutrition_cache
+from nutrition_tracker.reference import reference_index
+from nutrition_tracker.gemini import gemini_client, warm_up
+from nutrition_tracker.ocr import read_text_lines, extract_grocery_items
+from nutrition_tracker.bill_cache import bill_cache
+from nutrition_tracker.singleflight import SingleFlight
+from nutrition_tracker.analytics import get_nutrition_trends
+from nutrition_tracker.write_behind import write_behind, log_nutrition, LogJournal, LOG_WRITE_BEHIND, LOG_JOURNAL_PATH, LOG_DRAIN_TIMEOUT_SECONDS
+from nutrition_tracker.shared_state import MCP_WORKERS, SHARED_STATE
+from nutrition_tracker.history import fetch_history_page, format_rows, check_format, HISTORY_PAGE_SIZE
+from nutrition_tracker.metrics import trace, render, recent_slow_traces, start_metrics_server, CONTENT_TYPE
 from datetime import datetime
 
 # --- Load Environment Variables ---
@@ -59,17 +74,58 @@ class RichToolDescription(BaseModel):
     use_when: str
     side_effects: str | None = None
 
+# --- Tool Tracing ---
+class ToolTracingMiddleware(Middleware):
+    """Runs every tool call inside a trace, so its Gemini, OCR, SQL and parse spans are attributed to it."""
+
+    async def on_call_tool(self, context, call_next):
+        with trace("tool", context.message.name):
+            return await call_next(context)
+
 # --- MCP Server Setup ---
 mcp = FastMCP(
     "Nutrition Tracker MCP Server",
     auth=SimpleBearerAuthProvider(TOKEN),
 )
+mcp.add_middleware(ToolTracingMiddleware())
 
 # --- Validation Tool (required by Puch) ---
 @mcp.tool
 def validate() -> str:
     return MY_NUMBER
 
+# --- Health Endpoint ---
+@mcp.custom_route("/health", methods=["GET"])
+async def health(request: Request) -> JSONResponse:
+    """
+    Liveness plus DB connection pool usage (checked-out connections, overflow, wait time).
+    """
+    from nutrition_tracker.db import engine, get_pool_status
+    from sqlalchemy import text
+    db_ok = True
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        print(f"Health check DB error: {e}")
+        db_ok = False
+    return JSONResponse(
+        {"status": "ok" if db_ok else "degraded", "database": db_ok, "pool": get_pool_status(),
+         "write_behind": write_behind.get_stats()},
+        status_code=200 if db_ok else 503,
+    )
+
+# --- Metrics Endpoints ---
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> PlainTextResponse:
+    """Prometheus text format: span latency histograms, error counts and cache/pool counters."""
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
+
+@mcp.custom_route("/traces", methods=["GET"])
+async def traces(request: Request) -> JSONResponse:
+    """The most recent tool calls slower than TRACE_SLOW_MS, with a per-kind time breakdown."""
+    return JSONResponse(recent_slow_traces())
+
 # --- Nutrition Details Tool (no DB, just Gemini) ---
 GET_NUTRITION_DESCRIPTION = RichToolDescription(
     description="""
@@ -91,13 +147,82 @@ async def get_nutrition(
     """
     if not user_id:
         raise McpError(ErrorData(code=INVALID_PARAMS, message="User ID is required."))
-    nutrition = get_nutrition_from_gemini(food, amount)
+    try:
+        nutrition = await get_nutrition_cached(food, amount)
+    except GeminiConfigError as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=str(e)))
     required_keys = ["calories", "protein", "carbs", "fat"]
     if not nutrition or any(nutrition.get(k) is None for k in required_keys):
         raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Could not get nutrition info for {amount} {food}. Please try a different food or amount."))
     # Database logging removed as requested
     return nutrition
 
+# --- Batch Nutrition Tool ---
+class FoodAmount(BaseModel):
+    food: str = Field(description="Food name, e.g. 'roti'")
+    amount: float = Field(description="Amount (e.g. 2 for 2 rotis or 100 for 100g rice)")
+
+GET_NUTRITION_BATCH_DESCRIPTION = RichToolDescription(
+    description="""
+    Use this tool to get nutrition information for several foods from one meal in a single call.\n
+    Provide the user ID and a list of items, each with a food name and amount (e.g. 2 roti, 1 dal, 100 g rice).\n    The tool returns calories, protein, carbs and fat for each item in the same order, plus the meal total.
+    """,
+    use_when="User describes a meal with several foods, e.g. '2 rotis, dal, 100g rice, curd'.",
+    side_effects="None. Only returns nutrition estimates, does not log anything.",
+)
+
+@mcp.tool(description=GET_NUTRITION_BATCH_DESCRIPTION.model_dump_json())
+async def get_nutrition_for_meal(
+    user_id: Annotated[str, Field(description="Unique user identifier")],
+    items: Annotated[list[FoodAmount], Field(description="Foods and amounts in the meal")],
+) -> dict:
+    """
+    Returns nutrition for every item of a meal using one batched Gemini call.
+    """
+    if not user_id:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message="User ID is required."))
+    if not items:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message="Items must be a non-empty list of foods and amounts."))
+    try:
+        results = await get_nutrition_batch([(item.food, item.amount) for item in items])
+    except GeminiConfigError as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=str(e)))
+    if not any(results):
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message="Could not get nutrition info for any of the items."))
+    entries = []
+    total = {"calories": 0.0, "protein": 0.0, "carbs": 0.0, "fat": 0.0}
+    for item, nutrition in zip(items, results):
+        if nutrition is None:
+            entries.append({"food": item.food, "amount": item.amount, "error": "Could not get nutrition info."})
+            continue
+        entries.append({"food": item.food, "amount": item.amount, **nutrition})
+        for k in total:
+            total[k] += nutrition[k]
+    return {"items": entries, "total": total}
+
+# --- Nutrition Cache Stats Tool ---
+NUTRITION_CACHE_STATS_DESCRIPTION = RichToolDescription(
+    description="Returns hit/miss counters for the nutrition lookup cache that sits in front of Gemini, and how many lookups were coalesced into a shared in-flight Gemini call.",
+    use_when="Operator wants to check how many nutrition lookups are served without calling Gemini.",
+    side_effects="None. Only reads in-process counters.",
+)
+
+@mcp.tool(description=NUTRITION_CACHE_STATS_DESCRIPTION.model_dump_json())
+async def nutrition_cache_stats() -> dict:
+    """
+    Returns the nutrition cache counters (hits, scaled hits, DB hits, misses, hit ratio)
+    and the request coalescing counters (calls, executed, coalesced, in flight), plus
+    how many lookups the local reference index answered, the Gemini client's
+    call, retry and rate-limit counters, and the dish suggestion cache counters.
+    """
+    return {
+        **nutrition_cache.get_stats(),
+        "coalescing": nutrition_flight.get_stats(),
+        "reference": reference_index.get_stats(),
+        "gemini": gemini_client.get_stats(),
+        "dishes": dish_cache.get_stats(),
+    }
+
 # --- Nutrition Board Tool ---
 NUTRITION_BOARD_DESCRIPTION = RichToolDescription(
     description="""
@@ -140,10 +265,10 @@ async def nutrition_board(
 SUGGEST_DISHES_DESCRIPTION = RichToolDescription(
     description="""
     Suggests 3 creative, healthy dish names using ONLY the provided ingredients.\n
-    Provide a list of ingredients (e.g., ['egg', 'spinach', 'cheese']).\n    The tool will return a JSON array of 3 possible dish names.\n    Powered by Gemini.
+    Provide a list of ingredients (e.g., ['egg', 'spinach', 'cheese']).\n    The tool will return a JSON array of 3 possible dish names.\n    Powered by Gemini; suggestions for the same (or a very similar) set of ingredients are reused.
     """,
     use_when="User wants to know what dishes they can make with available ingredients.",
-    side_effects="None. Only returns dish name suggestions, does not log or store anything.",
+    side_effects="Looks up nutrition for the suggested dishes in the background, so logging one is fast. Does not log anything.",
 )
 
 @mcp.tool(description=SUGGEST_DISHES_DESCRIPTION.model_dump_json())
@@ -155,7 +280,10 @@ async def suggest_dishes(
     """
     if not ingredients or not isinstance(ingredients, list):
         raise McpError(ErrorData(code=INVALID_PARAMS, message="Ingredients must be a non-empty list of strings."))
-    dishes = suggest_dishes_from_gemini(ingredients)
+    try:
+        dishes = await suggest_dishes_cached(ingredients)
+    except GeminiConfigError as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=str(e)))
     if not dishes:
         raise McpError(ErrorData(code=INTERNAL_ERROR, message="Could not get dish suggestions from Gemini."))
     return dishes
@@ -188,44 +316,80 @@ async def lock_dish(
         raise McpError(ErrorData(code=INVALID_PARAMS, message="Dish name is required."))
     if not nutrition or not required_keys.issubset(nutrition) or any(nutrition[k] is None for k in required_keys):
         raise McpError(ErrorData(code=INVALID_PARAMS, message="Nutrition must include valid calories, protein, carbs, and fat (not None)."))
+    now = datetime.utcnow()
     log_entry = {
-        'timestamp': datetime.utcnow().isoformat(),
+        'timestamp': now.isoformat(),
         'user_id': user_id,
         'food': dish,
         'amount': 1,
         'nutrition': {k: float(nutrition[k]) for k in required_keys}
     }
-    from nutrition_tracker.db import AsyncSessionLocal
-    from nutrition_tracker.models import User, NutritionLog, NutritionTotals
-    from sqlalchemy import select
-    async with AsyncSessionLocal() as session:
-        # Get or create user
-        user = (await session.execute(select(User).where(User.user_id == user_id))).scalar_one_or_none()
-        if not user:
-            user = User(user_id=user_id)
-            session.add(user)
-            await session.flush()
-        # Add nutrition log for dish
-        log = NutritionLog(user_id=user.id, food=dish, amount=1, calories=nutrition['calories'], protein=nutrition['protein'], carbs=nutrition['carbs'], fat=nutrition['fat'])
-        session.add(log)
-        # Update totals
-        totals = (await session.execute(select(NutritionTotals).where(NutritionTotals.user_id == user.id))).scalar_one_or_none()
-        if not totals:
-            totals = NutritionTotals(
-                user_id=user.id,
-                calories=0.0,
-                protein=0.0,
-                carbs=0.0,
-                fat=0.0,
-            )
-            session.add(totals)
-        totals.calories = (totals.calories or 0.0) + nutrition['calories']
-        totals.protein = (totals.protein or 0.0) + nutrition['protein']
-        totals.carbs = (totals.carbs or 0.0) + nutrition['carbs']
-        totals.fat = (totals.fat or 0.0) + nutrition['fat']
-        await session.commit()
+    await log_nutrition(user_id, dish, 1, log_entry['nutrition'], timestamp=now)
     return log_entry
 
+# --- Nutrition Trends Tool ---
+NUTRITION_TRENDS_DESCRIPTION = RichToolDescription(
+    description="""
+    Returns the user's nutrition trends for a date range: daily totals with rolling 7-day and 30-day averages,
+    weekly and monthly totals and daily averages, and the protein/carbs/fat share of calories.\n
+    Dates are YYYY-MM-DD; the default range is the last 90 days.
+    """,
+    use_when="User asks how their eating is trending, e.g. weekly averages, this month vs last month, or their macro split.",
+    side_effects="None. Only reads the daily nutrition rollup.",
+)
+
+@mcp.tool(description=NUTRITION_TRENDS_DESCRIPTION.model_dump_json())
+async def nutrition_trends(
+    user_id: Annotated[str, Field(description="Unique user identifier")],
+    start_date: Annotated[str | None, Field(description="First day to include, YYYY-MM-DD")] = None,
+    end_date: Annotated[str | None, Field(description="Last day to include, YYYY-MM-DD (default today)")] = None,
+) -> dict:
+    """
+    Returns rolling averages, weekly/monthly buckets and macro percentages, computed in the database.
+    """
+    if not user_id:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message="User ID is required."))
+    try:
+        return await get_nutrition_trends(user_id, start_date, end_date)
+    except ValueError as e:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=str(e)))
+
+# --- Nutrition History Export Tool ---
+EXPORT_HISTORY_DESCRIPTION = RichToolDescription(
+    description="""
+    Exports the user's logged foods (timestamp, food, amount, calories, protein, carbs, fat) as CSV or NDJSON, one page at a time.\n
+    Pass the returned next_cursor back in to get the following page; next_cursor is null once the whole history has been returned.
+    """,
+    use_when="User wants to download or review their full food log history, optionally for a date range.",
+    side_effects="None. Only reads the nutrition log.",
+)
+
+@mcp.tool(description=EXPORT_HISTORY_DESCRIPTION.model_dump_json())
+async def export_nutrition_history(
+    user_id: Annotated[str, Field(description="Unique user identifier")],
+    format: Annotated[str, Field(description="'csv' or 'ndjson'")] = "csv",
+    cursor: Annotated[str | None, Field(description="next_cursor from the previous page; omit for the first page")] = None,
+    limit: Annotated[int, Field(description="Rows per page (max 5000)")] = HISTORY_PAGE_SIZE,
+    start_date: Annotated[str | None, Field(description="First day to include, YYYY-MM-DD")] = None,
+    end_date: Annotated[str | None, Field(description="Last day to include, YYYY-MM-DD")] = None,
+) -> dict:
+    """
+    Returns one page of the user's nutrition log, oldest first, with a cursor for the next page.
+    """
+    if not user_id:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message="User ID is required."))
+    try:
+        fmt = check_format(format)
+        rows, next_cursor = await fetch_history_page(user_id, cursor, limit, start_date, end_date)
+    except ValueError as e:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=str(e)))
+    return {
+        "format": fmt,
+        "rows": len(rows),
+        "data": format_rows(rows, fmt, header=fmt == "csv" and cursor is None),
+        "next_cursor": next_cursor,
+    }
+
 # # --- Am I a Hero Tool ---
 #
 # AM_I_A_HERO_DESCRIPTION = RichToolDescription(
@@ -244,6 +408,8 @@ async def lock_dish(
 #     return "Ask me if you are a hero!"
 #
 # --- Grocery Bill OCR Tool ---
+ocr_flight = SingleFlight()
+
 SCAN_GROCERY_BILL_DESCRIPTION = RichToolDescription(
     description="Scan a grocery bill image and extract a list of purchased items using Azure AI Vision OCR.",
     use_when="Use this tool when the user sends a photo of a grocery bill to extract item names.",
@@ -255,49 +421,134 @@ async def scan_grocery_bill(
     user_id: Annotated[str, Field(description="Unique user identifier")],
     puch_image_data: Annotated[str, Field(description="Base64-encoded image data of the grocery bill")],
 ) -> list:
-    import base64
-    import io
-    from azure.cognitiveservices.vision.computervision import ComputerVisionClient
-    from azure.cognitiveservices.vision.computervision.models import OperationStatusCodes
-    from msrest.authentication import CognitiveServicesCredentials
-    import time
-
-    VISION_KEY = os.environ.get("VISION_KEY")
-    VISION_ENDPOINT = os.environ.get("VISION_ENDPOINT")
-    if not VISION_KEY or not VISION_ENDPOINT:
-        raise McpError(ErrorData(code=INTERNAL_ERROR, message="Azure Vision credentials not set in environment."))
+    """
+    OCRs the bill without blocking the event loop and returns the detected item lines.
+    Photos seen before (the same bytes, or with BILL_PHASH_MAX_DISTANCE set a near-identical
+    photo from the same user) are answered from the bill cache without calling OCR.
+    """
     try:
         image_bytes = base64.b64decode(puch_image_data)
-        computervision_client = ComputerVisionClient(
-            VISION_ENDPOINT, CognitiveServicesCredentials(VISION_KEY)
-        )
-        image_stream = io.BytesIO(image_bytes)
-        read_response = computervision_client.read_in_stream(image_stream, raw=True)
-        operation_location = read_response.headers["Operation-Location"]
-        operation_id = operation_location.split("/")[-1]
-        while True:
-            result = computervision_client.get_read_result(operation_id)
-            if result.status not in ["notStarted", "running"]:
-                break
-            time.sleep(1)
-        if result.status == OperationStatusCodes.succeeded:
-            lines = []
-            for page in result.analyze_result.read_results:
-                for line in page.lines:
-                    lines.append(line.text)
-            # Simple heuristic: filter out lines that look like totals, prices, etc.
-            items = [l for l in lines if l and not any(x in l.lower() for x in ["total", "amount", "price", "rs", "$", "qty", "tax"])]
-            # Return detected items (no inventory update)
-            return items
-        else:
-            raise McpError(ErrorData(code=INTERNAL_ERROR, message="OCR failed to extract text from image."))
+    except Exception:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message="Image data must be valid base64."))
+    cached, key = await bill_cache.get(user_id, image_bytes)
+    if cached is not None:
+        return cached
+    try:
+        # Retries of the same photo while its OCR job is running share that job.
+        lines = await ocr_flight.do(key[0], lambda: read_text_lines(image_bytes))
     except Exception as e:
         raise McpError(ErrorData(code=INTERNAL_ERROR, message=str(e)))
+    # Return detected items (no inventory update)
+    items = extract_grocery_items(lines)
+    await bill_cache.put(user_id, image_bytes, items, key)
+    return items
 
 # --- Run MCP Server ---
-async def main():
-    print("🚀 Starting MCP server on http://0.0.0.0:8086")
-    await mcp.run_async("streamable-http", host="0.0.0.0", port=8086)
+MCP_HOST = os.environ.get("MCP_HOST", "0.0.0.0")
+MCP_PORT = int(os.environ.get("MCP_PORT", 8086))
+# Load the Gemini SDK in the background once the server is up, instead of on the first request.
+MCP_WARMUP = os.environ.get("MCP_WARMUP", "1").strip().lower() not in ("0", "false", "no", "off")
+# How long a stopping server waits for in-flight requests before cancelling them.
+MCP_GRACEFUL_TIMEOUT = float(os.environ.get("MCP_GRACEFUL_TIMEOUT", 30))
+# Optional separate Prometheus port; worker n listens on METRICS_PORT + n.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+
+async def main(sock: socket.socket | None = None, worker: int = 0):
+    """Runs one server process; `sock` is the listening socket inherited from the pre-fork parent."""
+    where = f" (worker {worker}, pid {os.getpid()})" if sock is not None else ""
+    print(f"🚀 Starting MCP server on http://{MCP_HOST}:{MCP_PORT}{where}")
+    if MCP_WARMUP:
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+    if LOG_WRITE_BEHIND:
+        if sock is not None and LOG_JOURNAL_PATH:
+            # One journal per worker, so no worker replays entries another one already queued.
+            write_behind.journal = LogJournal(f"{LOG_JOURNAL_PATH}.{worker}")
+        if LOG_JOURNAL_PATH and worker == 0:
+            # Journals of worker slots that no longer exist would otherwise never be replayed.
+            await write_behind.replay_orphans(LOG_JOURNAL_PATH, MCP_WORKERS if sock is not None else 0)
+        await write_behind.start()
+    metrics_server = await start_metrics_server(MCP_HOST, METRICS_PORT + worker) if METRICS_PORT else None
+    uvicorn_config = {"timeout_graceful_shutdown": MCP_GRACEFUL_TIMEOUT}
+    try:
+        if sock is None:
+            await mcp.run_async("streamable-http", host=MCP_HOST, port=MCP_PORT, uvicorn_config=uvicorn_config)
+        else:
+            # Stateless HTTP: no MCP session is pinned to one process, so any worker can take any request.
+            app = mcp.http_app(transport="streamable-http", stateless_http=True)
+            await uvicorn.Server(uvicorn.Config(app, lifespan="on", **uvicorn_config)).serve(sockets=[sock])
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        # Drain queued log entries before exiting.
+        await write_behind.stop()
+
+def run_workers(workers: int) -> None:
+    """
+    Pre-fork mode: binds the port once and forks `workers` processes that all accept on it.
+    A worker that dies is restarted. On SIGTERM/SIGINT every worker finishes its in-flight
+    requests and drains its write-behind queue; stragglers are killed after a deadline.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((MCP_HOST, MCP_PORT))
+    sock.listen(2048)
+    children: dict[int, int] = {}
+    stopping_since: float | None = None
+
+    def spawn(worker: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                asyncio.run(main(sock, worker))
+            except Exception as e:
+                print(f"Worker {worker} failed: {type(e).__name__}: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        children[pid] = worker
+
+    def signal_children(sig: int) -> None:
+        for pid in list(children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping_since
+        if stopping_since is None:
+            stopping_since = time.monotonic()
+            print(f"Stopping {len(children)} workers...")
+            signal_children(signal.SIGTERM)
+
+    print(f"Pre-forking {workers} workers on {MCP_HOST}:{MCP_PORT} (shared state: {SHARED_STATE})")
+    for worker in range(workers):
+        spawn(worker)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    kill_after = MCP_GRACEFUL_TIMEOUT + LOG_DRAIN_TIMEOUT_SECONDS + 5
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping_since is not None and time.monotonic() - stopping_since > kill_after:
+                print(f"Killing {len(children)} workers that did not stop within {kill_after:.0f}s")
+                signal_children(signal.SIGKILL)
+            time.sleep(0.2)
+            continue
+        worker = children.pop(pid, None)
+        if worker is not None and stopping_since is None:
+            print(f"Worker {worker} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting it")
+            time.sleep(1)
+            spawn(worker)
+    sock.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if MCP_WORKERS > 1:
+        run_workers(MCP_WORKERS)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,212 @@
+"""
+Nutrition trend analytics computed in the database.
+
+Everything is read from the nutrition_daily rollup with aggregate SQL: rolling
+averages use window functions over a day-number range, week/month buckets use
+GROUP BY on the truncated day, and macro percentages are sums of per-day rows.
+Only the result rows come back to Python. Results are cached per user and the
+user's entries are dropped whenever log_nutrition_to_db writes a new log (with
+SHARED_STATE=db, whenever any worker writes one).
+"""
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Date, cast, func, select
+
+from nutrition_tracker.cache import LRUCache
+from nutrition_tracker.db import AsyncSessionLocal, get_engine
+from nutrition_tracker.metrics import register_stats
+from nutrition_tracker.models import User, NutritionDaily
+from nutrition_tracker.normalize import NUTRIENT_KEYS
+from nutrition_tracker.shared_state import SHARED_STATE, data_version
+
+ANALYTICS_DEFAULT_DAYS = int(os.environ.get("ANALYTICS_DEFAULT_DAYS", 90))
+ANALYTICS_CACHE_TTL = int(os.environ.get("ANALYTICS_CACHE_TTL", 3600))
+ANALYTICS_CACHE_SIZE = int(os.environ.get("ANALYTICS_CACHE_SIZE", 1024))
+ROLLING_WINDOWS = (7, 30)
+PERIODS = ("week", "month")
+# Energy per gram, for the macro percentage breakdown.
+KCAL_PER_GRAM = {"protein": 4.0, "carbs": 4.0, "fat": 9.0}
+
+
+def _dialect() -> str:
+    return get_engine().dialect.name
+
+
+def _day_number():
+    """Day as a number, so RANGE window frames can count calendar days (gaps included)."""
+    if _dialect() == "sqlite":
+        return func.julianday(NutritionDaily.day)
+    return func.extract("epoch", NutritionDaily.day) / 86400
+
+
+def _period_start(period: str):
+    if _dialect() == "sqlite":
+        if period == "week":
+            # Monday of the day's ISO week.
+            return func.date(NutritionDaily.day, "weekday 0", "-6 days")
+        return func.strftime("%Y-%m-01", NutritionDaily.day)
+    return cast(func.date_trunc(period, NutritionDaily.day), Date)
+
+
+def _as_iso(value) -> str:
+    # Date expressions come back as dates on PostgreSQL and as strings on SQLite.
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+def _date_range(start_date: Optional[str], end_date: Optional[str]) -> Tuple[date, date]:
+    """YYYY-MM-DD strings to an inclusive date range; defaults to the last ANALYTICS_DEFAULT_DAYS days."""
+    end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else datetime.utcnow().date()
+    start = (
+        datetime.strptime(start_date, "%Y-%m-%d").date() if start_date
+        else end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    )
+    if start > end:
+        raise ValueError("start_date must not be after end_date")
+    return start, end
+
+
+async def _user_pk(session, user_id: str) -> Optional[int]:
+    return (await session.execute(select(User.id).where(User.user_id == user_id))).scalar_one_or_none()
+
+
+async def _rolling_averages(session, user_pk: int, start: date, end: date) -> List[Dict[str, Any]]:
+    day_number = _day_number()
+    columns = [NutritionDaily.day.label("day")]
+    columns += [getattr(NutritionDaily, k).label(k) for k in NUTRIENT_KEYS]
+    for days in ROLLING_WINDOWS:
+        # Average per logged day over the trailing `days` calendar days.
+        window = {"partition_by": NutritionDaily.user_id, "order_by": day_number, "range_": (-(days - 1), 0)}
+        columns.append(func.count().over(**window).label(f"days_{days}d"))
+        columns += [func.avg(getattr(NutritionDaily, k)).over(**window).label(f"{k}_{days}d") for k in NUTRIENT_KEYS]
+    # Days before `start` still feed the first windows, then the outer query trims them.
+    inner = (
+        select(*columns)
+        .where(
+            NutritionDaily.user_id == user_pk,
+            NutritionDaily.day >= start - timedelta(days=max(ROLLING_WINDOWS) - 1),
+            NutritionDaily.day <= end,
+        )
+        .subquery()
+    )
+    rows = (await session.execute(select(inner).where(inner.c.day >= start).order_by(inner.c.day))).mappings().all()
+    return [
+        {
+            "date": _as_iso(row["day"]),
+            **{k: float(row[k] or 0) for k in NUTRIENT_KEYS},
+            **{
+                f"avg_{days}d": {
+                    "days_logged": row[f"days_{days}d"],
+                    **{k: round(float(row[f"{k}_{days}d"] or 0), 2) for k in NUTRIENT_KEYS},
+                }
+                for days in ROLLING_WINDOWS
+            },
+        }
+        for row in rows
+    ]
+
+
+async def _period_buckets(session, user_pk: int, start: date, end: date, period: str) -> List[Dict[str, Any]]:
+    bucket = _period_start(period).label("period_start")
+    query = (
+        select(
+            bucket,
+            func.count().label("days_logged"),
+            func.sum(NutritionDaily.entries).label("entries"),
+            *[func.sum(getattr(NutritionDaily, k)).label(k) for k in NUTRIENT_KEYS],
+        )
+        .where(NutritionDaily.user_id == user_pk, NutritionDaily.day >= start, NutritionDaily.day <= end)
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    buckets = []
+    for row in (await session.execute(query)).mappings():
+        totals = {k: float(row[k] or 0) for k in NUTRIENT_KEYS}
+        days = row["days_logged"] or 1
+        buckets.append({
+            "period_start": _as_iso(row["period_start"]),
+            "days_logged": row["days_logged"],
+            "entries": int(row["entries"] or 0),
+            "total": totals,
+            "daily_average": {k: round(v / days, 2) for k, v in totals.items()},
+        })
+    return buckets
+
+
+async def _macro_breakdown(session, user_pk: int, start: date, end: date) -> Dict[str, Any]:
+    energy = {k: func.coalesce(func.sum(getattr(NutritionDaily, k)), 0.0) * kcal for k, kcal in KCAL_PER_GRAM.items()}
+    macro_kcal = energy["protein"] + energy["carbs"] + energy["fat"]
+    query = select(
+        func.coalesce(func.sum(NutritionDaily.calories), 0.0).label("calories"),
+        macro_kcal.label("macro_kcal"),
+        *[(100.0 * e / func.nullif(macro_kcal, 0)).label(f"{k}_pct") for k, e in energy.items()],
+    ).where(NutritionDaily.user_id == user_pk, NutritionDaily.day >= start, NutritionDaily.day <= end)
+    row = (await session.execute(query)).mappings().one()
+    return {
+        "calories": float(row["calories"]),
+        "macro_kcal": float(row["macro_kcal"]),
+        **{f"{k}_pct": round(float(row[f"{k}_pct"] or 0), 1) for k in KCAL_PER_GRAM},
+    }
+
+
+class TrendCache:
+    """Per-user cache of analytics results. Writing a log for a user bumps that user's version."""
+
+    def __init__(self, maxsize: int = ANALYTICS_CACHE_SIZE, ttl: float = ANALYTICS_CACHE_TTL):
+        self._results = LRUCache(maxsize, ttl)
+        self._versions: Dict[str, int] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _key(self, user_id: str, *args) -> tuple:
+        return (user_id, self._versions.get(user_id, 0), *args)
+
+    def get(self, user_id: str, *args) -> Optional[Any]:
+        value = self._results.get(self._key(user_id, *args))
+        self.stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, user_id: str, value: Any, *args) -> None:
+        self._results.set(self._key(user_id, *args), value)
+
+    def invalidate(self, user_id: str) -> None:
+        # Old entries become unreachable and age out of the LRU.
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._results)}
+
+
+trend_cache = TrendCache()
+register_stats("trend_cache", trend_cache.get_stats)
+
+
+async def get_nutrition_trends(
+    user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Returns daily totals with rolling 7/30-day averages, weekly and monthly buckets and the
+    macro energy split for the user over [start_date, end_date] (YYYY-MM-DD, inclusive).
+    Raises ValueError on a malformed or inverted date range.
+    """
+    start, end = _date_range(start_date, end_date)
+    # Other workers do not see this process's invalidations, so also key on the data itself.
+    version = await data_version(user_id) if SHARED_STATE == "db" else None
+    cached = trend_cache.get(user_id, start, end, version)
+    if cached is not None:
+        return cached
+    async with AsyncSessionLocal() as session:
+        user_pk = await _user_pk(session, user_id)
+        result = {"user_id": user_id, "start_date": start.isoformat(), "end_date": end.isoformat()}
+        if user_pk is None:
+            result.update(daily=[], weekly=[], monthly=[], macros=None)
+        else:
+            result.update(
+                daily=await _rolling_averages(session, user_pk, start, end),
+                weekly=await _period_buckets(session, user_pk, start, end, "week"),
+                monthly=await _period_buckets(session, user_pk, start, end, "month"),
+                macros=await _macro_breakdown(session, user_pk, start, end),
+            )
+    trend_cache.set(user_id, result, start, end, version)
+    return result
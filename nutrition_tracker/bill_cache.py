@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Any
+
+from sqlalchemy import delete, select
+
+from nutrition_tracker.cache import LRUCache
+from nutrition_tracker.db import AsyncSessionLocal, dialect_insert
+from nutrition_tracker.metrics import register_stats
+from nutrition_tracker.models import ScannedBill
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+BILL_CACHE_TTL_SECONDS = int(os.environ.get("BILL_CACHE_TTL", 7 * 24 * 3600))
+BILL_CACHE_SIZE = int(os.environ.get("BILL_CACHE_SIZE", 256))
+# Near-duplicate matching is off by default (-1): two bills from the same store can look
+# alike at thumbnail size, and a false match returns another bill's items. When set, it is
+# the max differing bits (of 256) for a same-user photo to count as the same bill.
+BILL_PHASH_MAX_DISTANCE = int(os.environ.get("BILL_PHASH_MAX_DISTANCE", -1))
+# dHash grid width; the hash has HASH_SIZE * HASH_SIZE bits.
+BILL_PHASH_SIZE = 16
+# How many of a user's recent bills are compared for near-duplicates.
+BILL_NEAR_DUPLICATE_CANDIDATES = 50
+# How often (seconds) a cache write also deletes expired scanned_bills rows.
+BILL_CACHE_PURGE_INTERVAL = int(os.environ.get("BILL_CACHE_PURGE_INTERVAL", 3600))
+
+# (sha256 of the bytes, perceptual hash or None); returned by BillCache.get for put.
+# The perceptual hash is only computed when near-duplicate matching is on.
+BillKey = Tuple[str, Optional[str]]
+
+
+def perceptual_hash(image: "Image.Image", size: int = BILL_PHASH_SIZE) -> str:
+    """size*size-bit difference hash (dHash) as hex; robust to re-encoding and resizing."""
+    from PIL import Image
+    small = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            bits = (bits << 1) | (pixels[row * (size + 1) + col] > pixels[row * (size + 1) + col + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def image_phash(image_bytes: bytes) -> Optional[str]:
+    """Decodes the image and returns its perceptual hash, or None if it is not a readable image."""
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return perceptual_hash(ImageOps.exif_transpose(image))
+    except Exception:
+        return None
+
+
+class BillCache:
+    """
+    Cache of OCR'd grocery bill items, keyed on the image content hash, with an opt-in
+    perceptual-hash match for near-duplicate photos from the same user (max_distance >= 0).
+    A bounded in-process LRU sits in front of the scanned_bills table. The image is
+    only decoded for the perceptual hash when matching is on and its exact hash is not cached.
+    """
+
+    def __init__(self, maxsize: int = BILL_CACHE_SIZE, ttl: float = BILL_CACHE_TTL_SECONDS,
+                 max_distance: int = BILL_PHASH_MAX_DISTANCE):
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._memory = LRUCache(maxsize, ttl)
+        self.stats = {"hits": 0, "db_hits": 0, "near_hits": 0, "misses": 0, "db_errors": 0, "purged": 0}
+        self._next_purge = 0.0
+
+    async def get(self, user_id: str, image_bytes: bytes) -> Tuple[Optional[List[str]], BillKey]:
+        """
+        Returns (cached items or None, key). Pass the key to put() after an OCR,
+        so the image is not hashed and decoded again.
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        items = self._memory.get(digest)
+        if items is not None:
+            self.stats["hits"] += 1
+            return list(items), (digest, None)
+        now = datetime.utcnow()
+        phash = None
+        try:
+            async with AsyncSessionLocal() as session:
+                row = (await session.execute(
+                    select(ScannedBill).where(ScannedBill.content_hash == digest, ScannedBill.expires_at > now)
+                )).scalar_one_or_none()
+            if row is not None:
+                self.stats["db_hits"] += 1
+            elif self.max_distance >= 0:
+                phash = await asyncio.to_thread(image_phash, image_bytes)
+                row = await self._near_duplicate(user_id, phash, now) if phash is not None else None
+                if row is not None:
+                    self.stats["near_hits"] += 1
+        except Exception as e:
+            self.stats["db_errors"] += 1
+            print(f"Error reading bill cache: {e}")
+            row = None
+        if row is None:
+            self.stats["misses"] += 1
+            return None, (digest, phash)
+        items = json.loads(row.items)
+        self._memory.set(digest, items)
+        return list(items), (digest, phash)
+
+    async def _near_duplicate(self, user_id: str, phash: str, now: datetime) -> Optional[ScannedBill]:
+        """The user's closest recent bill within max_distance, if any."""
+        async with AsyncSessionLocal() as session:
+            candidates = (await session.execute(
+                select(ScannedBill)
+                .where(ScannedBill.user_id == user_id, ScannedBill.expires_at > now)
+                .order_by(ScannedBill.expires_at.desc())
+                .limit(BILL_NEAR_DUPLICATE_CANDIDATES)
+            )).scalars().all()
+        return min(
+            # Rows hashed at another size (or not at all) cannot be compared.
+            (c for c in candidates
+             if len(c.phash) == len(phash) and hamming_distance(c.phash, phash) <= self.max_distance),
+            key=lambda c: hamming_distance(c.phash, phash),
+            default=None,
+        )
+
+    async def put(self, user_id: str, image_bytes: bytes, items: List[str], key: Optional[BillKey] = None) -> None:
+        if key is None:
+            key = (hashlib.sha256(image_bytes).hexdigest(), None)
+        if key[1] is None and self.max_distance >= 0:
+            key = (key[0], await asyncio.to_thread(image_phash, image_bytes))
+        digest, phash = key
+        self._memory.set(digest, list(items))
+        now = datetime.utcnow()
+        values = {
+            "content_hash": digest,
+            "phash": phash or "",
+            "user_id": user_id,
+            "items": json.dumps(items),
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl),
+        }
+        stmt = dialect_insert(ScannedBill).values(**values)
+        # Re-scanning an image whose entry has expired refreshes that row in place. The row
+        # keeps its first owner, so another user sending the same image cannot take it over.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["content_hash"],
+            set_={k: stmt.excluded[k] for k in values if k not in ("content_hash", "user_id")},
+        )
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(stmt)
+                await session.commit()
+        except Exception as e:
+            self.stats["db_errors"] += 1
+            print(f"Error writing bill cache entry: {e}")
+            return
+        if time.monotonic() >= self._next_purge:
+            self._next_purge = time.monotonic() + BILL_CACHE_PURGE_INTERVAL
+            await self.purge_expired()
+
+    async def purge_expired(self) -> int:
+        """Deletes expired scanned_bills rows and returns how many went."""
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(delete(ScannedBill).where(ScannedBill.expires_at <= datetime.utcnow()))
+                await session.commit()
+        except Exception as e:
+            self.stats["db_errors"] += 1
+            print(f"Error purging bill cache: {e}")
+            return 0
+        purged = result.rowcount or 0
+        self.stats["purged"] += purged
+        return purged
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._memory)}
+
+
+bill_cache = BillCache()
+register_stats("bill_cache", bill_cache.get_stats)
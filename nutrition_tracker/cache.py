@@ -0,0 +1,196 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Tuple, Any
+
+from sqlalchemy import case, delete, select
+
+from nutrition_tracker.db import AsyncSessionLocal, dialect_insert
+from nutrition_tracker.metrics import register_stats
+from nutrition_tracker.models import NutritionCacheEntry
+from nutrition_tracker.normalize import NUTRIENT_KEYS, normalize_food
+
+CACHE_TTL_SECONDS = int(os.environ.get("NUTRITION_CACHE_TTL", 30 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get("NUTRITION_CACHE_SIZE", 2048))
+# How often (seconds) a cache write also deletes nutrition_cache rows older than the TTL.
+CACHE_PURGE_INTERVAL = int(os.environ.get("NUTRITION_CACHE_PURGE_INTERVAL", 3600))
+
+
+class LRUCache:
+    """Small in-process LRU cache where every entry expires after `ttl` seconds (or its own, shorter, ttl)."""
+
+    def __init__(self, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def ttl_left(self, key) -> Optional[float]:
+        """Seconds until the entry expires, or None if it is not cached."""
+        item = self._data.get(key)
+        return item[0] - time.monotonic() if item is not None else None
+
+    def __contains__(self, key) -> bool:
+        # Presence check that does not refresh the entry's LRU position.
+        item = self._data.get(key)
+        return item is not None and item[0] >= time.monotonic()
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _scale(profile: Dict[str, float], amount: float) -> Dict[str, float]:
+    return {k: round(profile[k] * amount, 2) for k in NUTRIENT_KEYS}
+
+
+class NutritionCache:
+    """
+    Cache in front of get_nutrition_from_gemini.
+    Lookups go: in-process exact entry -> in-process per-unit profile -> nutrition_cache table.
+    A known food at a new amount is answered by scaling its per-unit profile.
+    """
+
+    def __init__(self, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._exact = LRUCache(maxsize, ttl)
+        self._profiles = LRUCache(maxsize, ttl)
+        self.stats = {"hits": 0, "scaled_hits": 0, "db_hits": 0, "misses": 0, "db_errors": 0, "purged": 0}
+        self._next_purge = 0.0
+
+    async def get(self, food: str, amount: float) -> Optional[Dict[str, float]]:
+        name, qty, unit = normalize_food(food, amount)
+        if not name or qty <= 0:
+            return None
+        nutrition = self._exact.get((name, qty, unit))
+        if nutrition is not None:
+            self.stats["hits"] += 1
+            return dict(nutrition)
+        profile = self._profiles.get((name, unit))
+        if profile is not None:
+            self.stats["scaled_hits"] += 1
+            nutrition = _scale(profile, qty)
+            # Expires with the profile it was scaled from.
+            self._exact.set((name, qty, unit), nutrition, self._profiles.ttl_left((name, unit)))
+            return dict(nutrition)
+        nutrition = await self._get_from_db(name, qty, unit)
+        if nutrition is not None:
+            self.stats["db_hits"] += 1
+            return dict(nutrition)
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, food: str, amount: float, nutrition: Dict[str, float]) -> None:
+        name, qty, unit = normalize_food(food, amount)
+        if not name or qty <= 0:
+            return
+        nutrition = {k: float(nutrition[k]) for k in NUTRIENT_KEYS}
+        self._exact.set((name, qty, unit), nutrition)
+        self._profiles.set((name, unit), {k: v / qty for k, v in nutrition.items()})
+        values = {"food": name, "unit": unit, "amount": qty, **nutrition, "created_at": datetime.utcnow()}
+        stmt = dialect_insert(NutritionCacheEntry).values(**values)
+        # A new answer for a key whose row has expired (or that another worker cached
+        # first) replaces that row, so the database tier keeps serving the key.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["food", "unit", "amount"],
+            set_={k: stmt.excluded[k] for k in (*NUTRIENT_KEYS, "created_at")},
+        )
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(stmt)
+                await session.commit()
+        except Exception as e:
+            self.stats["db_errors"] += 1
+            print(f"Error writing nutrition cache entry: {e}")
+            return
+        if time.monotonic() >= self._next_purge:
+            self._next_purge = time.monotonic() + CACHE_PURGE_INTERVAL
+            await self.purge_expired()
+
+    async def purge_expired(self) -> int:
+        """Deletes nutrition_cache rows older than the TTL and returns how many went."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    delete(NutritionCacheEntry).where(NutritionCacheEntry.created_at < cutoff)
+                )
+                await session.commit()
+        except Exception as e:
+            self.stats["db_errors"] += 1
+            print(f"Error purging nutrition cache: {e}")
+            return 0
+        purged = result.rowcount or 0
+        self.stats["purged"] += purged
+        return purged
+
+    async def _get_from_db(self, name: str, qty: float, unit: str) -> Optional[Dict[str, float]]:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        try:
+            async with AsyncSessionLocal() as session:
+                # The row for this exact amount if there is one, else the newest to scale from.
+                source = (await session.execute(
+                    select(NutritionCacheEntry)
+                    .where(
+                        NutritionCacheEntry.food == name,
+                        NutritionCacheEntry.unit == unit,
+                        NutritionCacheEntry.created_at >= cutoff,
+                    )
+                    .order_by(
+                        case((NutritionCacheEntry.amount == qty, 0), else_=1),
+                        NutritionCacheEntry.created_at.desc(),
+                    )
+                    .limit(1)
+                )).scalar_one_or_none()
+        except Exception as e:
+            self.stats["db_errors"] += 1
+            print(f"Error reading nutrition cache: {e}")
+            return None
+        if source is None:
+            return None
+        exact = source.amount == qty
+        profile = {k: getattr(source, k) / source.amount for k in NUTRIENT_KEYS}
+        # Kept in memory only for what is left of the row's TTL, not a fresh one.
+        remaining = self.ttl - (datetime.utcnow() - source.created_at).total_seconds()
+        self._profiles.set((name, unit), profile, remaining)
+        nutrition = {k: getattr(source, k) for k in NUTRIENT_KEYS} if exact else _scale(profile, qty)
+        self._exact.set((name, qty, unit), nutrition, remaining)
+        return nutrition
+
+    def clear(self) -> None:
+        self._exact.clear()
+        self._profiles.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = sum(self.stats[k] for k in ("hits", "scaled_hits", "db_hits", "misses"))
+        served = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "lookups": lookups,
+            "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+            "entries": len(self._exact),
+            "profiles": len(self._profiles),
+        }
+
+
+nutrition_cache = NutritionCache()
+register_stats("cache", nutrition_cache.get_stats)
@@ -1,12 +1,19 @@
 import asyncio
-import os
 from dotenv import load_dotenv
-from nutrition_tracker.db import engine
+from nutrition_tracker.db import get_engine
 from nutrition_tracker.models import Base
 
+def create_missing_indexes(sync_conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
 async def create_all():
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips tables that already exist, so add any indexes
+        # introduced since those tables were created.
+        await conn.run_sync(create_missing_indexes)
     print("All tables created.")
 
 if __name__ == "__main__":
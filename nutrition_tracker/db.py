@@ -1,20 +1,174 @@
 import os
+import time
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.engine.url import URL
+from sqlalchemy.engine.url import URL, make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 
+from nutrition_tracker.metrics import METRICS_ENABLED, record, register_stats
+
 load_dotenv()
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL must be set in your environment or .env file.")
+def env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Engine settings (override via environment)
+DB_ECHO = env_bool("DB_ECHO", False)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+# asyncpg prepared statement cache; set to 0 behind PgBouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+
+# --- Pool metrics ---
+pool_metrics = {
+    "connects": 0,
+    "checkouts": 0,
+    "checkins": 0,
+    "invalidations": 0,
+    "wait_count": 0,
+    "wait_time_total": 0.0,
+    "wait_time_max": 0.0,
+}
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            pool_metrics["wait_count"] += 1
+            pool_metrics["wait_time_total"] += waited
+            pool_metrics["wait_time_max"] = max(pool_metrics["wait_time_max"], waited)
+
+def _engine_options(url: URL) -> tuple[URL, dict]:
+    options = {"echo": DB_ECHO, "future": True, "pool_pre_ping": DB_POOL_PRE_PING}
+    if url.get_backend_name() == "sqlite":
+        # SQLite picks its own pool (a static pool for :memory:), so leave sizing alone.
+        return url, options
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    if url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)})
+        options["connect_args"] = {"statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return url, options
+
+# The engine is created on first use, so importing this module never fails or
+# connects; a missing DATABASE_URL is reported by the first query instead.
+_engine = None
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        if not DATABASE_URL:
+            raise RuntimeError("DATABASE_URL must be set in your environment or .env file.")
+        url, options = _engine_options(make_url(DATABASE_URL))
+        _engine = create_async_engine(url, **options)
+        _install_pool_listeners(_engine)
+        if METRICS_ENABLED:
+            _install_sql_listeners(_engine)
+        register_stats("db_pool", get_pool_status)
+    return _engine
+
+def __getattr__(name):
+    # Keeps `from nutrition_tracker.db import engine` working without creating it at import.
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class LazyAsyncSession(AsyncSession):
+    """AsyncSession that binds to the shared engine when it is opened."""
+
+    def __init__(self, bind=None, **kwargs):
+        super().__init__(bind=bind if bind is not None else get_engine(), **kwargs)
 
-# Create async engine and sessionmaker
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
-AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+AsyncSessionLocal = async_sessionmaker(expire_on_commit=False, class_=LazyAsyncSession)
+
+def _install_pool_listeners(engine) -> None:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        pool_metrics["connects"] += 1
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics["checkouts"] += 1
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        pool_metrics["checkins"] += 1
+
+    @event.listens_for(engine.sync_engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics["invalidations"] += 1
+
+# --- SQL statement spans ---
+def _statement_kind(statement: str) -> str:
+    # First keyword only (SELECT, INSERT, ...), so the metric has few label values.
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "EMPTY"
+
+def _install_sql_listeners(engine) -> None:
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        context._span_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        record("sql", _statement_kind(statement), time.perf_counter() - context._span_started)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _on_error(exception_context):
+        context = exception_context.execution_context
+        started = getattr(context, "_span_started", None)
+        if started is not None:
+            record("sql", _statement_kind(exception_context.statement or ""), time.perf_counter() - started, error=True)
+
+def get_pool_status() -> dict:
+    """
+    Returns current pool usage plus cumulative counters, for sizing the pool under load.
+    """
+    pool = get_engine().pool
+    status = {"pool_class": type(pool).__name__, **pool_metrics}
+    if hasattr(pool, "checkedout"):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+            max_overflow=getattr(pool, "_max_overflow", None),
+        )
+    else:
+        status["checked_out"] = pool_metrics["checkouts"] - pool_metrics["checkins"]
+    if pool_metrics["wait_count"]:
+        status["wait_time_avg"] = pool_metrics["wait_time_total"] / pool_metrics["wait_count"]
+    return status
 
 # Dependency for getting a session (for FastAPI or manual use)
 async def get_session() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
+
+# Dialect-specific INSERT so callers can use ON CONFLICT upserts on both backends
+def dialect_insert(table):
+    dialect = get_engine().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upserts are not supported on {dialect}")
@@ -0,0 +1,131 @@
+"""
+Cache for Gemini dish suggestions, keyed on the pantry rather than the request text.
+
+The key is the set of normalized ingredient names, so "Tomatoes, eggs, onion" and
+"onion, egg, tomato" share one entry. When there is no exact entry, a cached pantry
+that is close enough answers instead:
+
+- a subset of the requested ingredients (its dishes only use things the user has),
+  if it covers at least DISH_CACHE_MIN_COVERAGE of them;
+- a superset with at most DISH_CACHE_MAX_MISSING ingredients the user did not list.
+  This is 0 by default, because those dishes may need something the user lacks.
+
+The closest match wins (by Jaccard similarity). Entries expire after DISH_CACHE_TTL
+and the least recently used are evicted beyond DISH_CACHE_SIZE.
+"""
+import os
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set
+
+from nutrition_tracker.cache import LRUCache
+from nutrition_tracker.metrics import register_stats
+from nutrition_tracker.normalize import normalize_food
+
+DISH_CACHE_TTL = int(os.environ.get("DISH_CACHE_TTL", 24 * 3600))
+DISH_CACHE_SIZE = int(os.environ.get("DISH_CACHE_SIZE", 1024))
+DISH_CACHE_MIN_COVERAGE = float(os.environ.get("DISH_CACHE_MIN_COVERAGE", 0.75))
+DISH_CACHE_MAX_MISSING = int(os.environ.get("DISH_CACHE_MAX_MISSING", 0))
+# Pantries compared per lookup, so a very common ingredient cannot make lookups slow.
+DISH_CACHE_MAX_CANDIDATES = 256
+
+
+def ingredient_key(ingredients: Iterable[str]) -> FrozenSet[str]:
+    """Canonical pantry: normalized, singular ingredient names without quantities or units."""
+    names = {normalize_food(i, 1)[0] for i in ingredients if isinstance(i, str)}
+    names.discard("")
+    return frozenset(names)
+
+
+class DishSuggestionCache:
+    def __init__(self, maxsize: int = DISH_CACHE_SIZE, ttl: float = DISH_CACHE_TTL):
+        self.maxsize = maxsize
+        self._entries = LRUCache(maxsize, ttl)
+        # Ingredient -> cached pantries containing it. Expired or evicted pantries are
+        # dropped when a lookup meets them, and in bulk once the index grows too large.
+        self._by_ingredient: Dict[str, Set[FrozenSet[str]]] = defaultdict(set)
+        self._indexed = 0
+        self.stats = {"hits": 0, "subset_hits": 0, "superset_hits": 0, "misses": 0}
+
+    def _closest(self, key: FrozenSet[str]) -> Optional[List[str]]:
+        best, best_score, best_kind = None, 0.0, None
+        seen: Set[FrozenSet[str]] = set()
+        for name in key:
+            if len(seen) > DISH_CACHE_MAX_CANDIDATES:
+                break
+            for pantry in list(self._by_ingredient.get(name, ())):
+                if pantry in seen:
+                    continue
+                seen.add(pantry)
+                if len(seen) > DISH_CACHE_MAX_CANDIDATES:
+                    break
+                if pantry <= key:
+                    if len(pantry) < DISH_CACHE_MIN_COVERAGE * len(key):
+                        continue
+                    kind = "subset_hits"
+                elif pantry >= key:
+                    if len(pantry - key) > DISH_CACHE_MAX_MISSING:
+                        continue
+                    kind = "superset_hits"
+                else:
+                    continue
+                score = len(pantry & key) / len(pantry | key)
+                if score <= best_score:
+                    continue
+                dishes = self._entries.get(pantry)
+                if dishes is None:
+                    self._unindex(pantry)
+                    continue
+                best, best_score, best_kind = dishes, score, kind
+        if best is not None:
+            self.stats[best_kind] += 1
+        return best
+
+    def get(self, ingredients: Iterable[str]) -> Optional[List[str]]:
+        key = ingredient_key(ingredients)
+        if not key:
+            return None
+        dishes = self._entries.get(key)
+        if dishes is not None:
+            self.stats["hits"] += 1
+            return list(dishes)
+        dishes = self._closest(key)
+        if dishes is None:
+            self.stats["misses"] += 1
+            return None
+        return list(dishes)
+
+    def set(self, ingredients: Iterable[str], dishes: List[str]) -> None:
+        key = ingredient_key(ingredients)
+        if not key or not dishes:
+            return
+        self._entries.set(key, list(dishes))
+        for name in key:
+            self._by_ingredient[name].add(key)
+        self._indexed += 1
+        if self._indexed > 2 * self.maxsize:
+            self._compact()
+
+    def _unindex(self, pantry: FrozenSet[str]) -> None:
+        for name in pantry:
+            pantries = self._by_ingredient.get(name)
+            if pantries is not None:
+                pantries.discard(pantry)
+                if not pantries:
+                    del self._by_ingredient[name]
+
+    def _compact(self) -> None:
+        live = {p for pantries in self._by_ingredient.values() for p in pantries if p in self._entries}
+        self._by_ingredient = defaultdict(set)
+        for pantry in live:
+            for name in pantry:
+                self._by_ingredient[name].add(pantry)
+        self._indexed = len(live)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = sum(self.stats.values())
+        hits = lookups - self.stats["misses"]
+        return {**self.stats, "entries": len(self._entries), "hit_ratio": round(hits / lookups, 3) if lookups else 0.0}
+
+
+dish_cache = DishSuggestionCache()
+register_stats("dish_cache", dish_cache.get_stats)
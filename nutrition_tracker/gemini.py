@@ -0,0 +1,308 @@
+import asyncio
+import importlib
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from nutrition_tracker.metrics import register_stats, span
+from nutrition_tracker.shared_state import MCP_WORKERS, SHARED_STATE, SharedTokenBucket
+
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# "google" (default) or "package.module:ClassName" for a stand-in model class (e.g. for load tests).
+# The class is built as Class(model_name, generation_config=...) and must provide
+# generate_content(prompt) and generate_content_async(prompt) returning an object with .text.
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "google")
+
+# Async calls share one concurrency limit and a per-call timeout so a slow
+# Gemini response cannot stall the event loop or pile up unbounded requests.
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+# Ask for JSON-mode output so responses arrive without code fences or prose.
+GEMINI_JSON_MODE = os.getenv("GEMINI_JSON_MODE", "1").strip().lower() not in ("0", "false", "no", "off")
+GENERATION_CONFIG = {"response_mime_type": "application/json"} if GEMINI_JSON_MODE else None
+
+# Requests-per-minute quota (token bucket; 0 disables) and how many requests may burst at once.
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+GEMINI_RPM_BURST = int(os.getenv("GEMINI_RPM_BURST", "10"))
+
+# Transient errors (429, 5xx, dropped connections) are retried with full-jitter backoff.
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", "0.5"))
+GEMINI_RETRY_MAX_SECONDS = float(os.getenv("GEMINI_RETRY_MAX_SECONDS", "8"))
+_TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class GeminiConfigError(RuntimeError):
+    pass
+
+
+class RateLimitExceeded(asyncio.TimeoutError):
+    """No rate-limit token frees up before the caller's deadline; raised instead of waiting it out."""
+
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    """
+    Imports and configures google.generativeai on first use, so importing this module
+    stays fast and tools that never call Gemini work without a key.
+    Raises GeminiConfigError if GEMINI_API_KEY is not set.
+    """
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                if not GEMINI_API_KEY:
+                    raise GeminiConfigError("GEMINI_API_KEY not set in environment.")
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                _genai = genai
+    return _genai
+
+
+def _build_model(name: str, generation_config: Optional[dict]):
+    if GEMINI_BACKEND == "google":
+        return get_genai().GenerativeModel(name, generation_config=generation_config)
+    module_name, _, class_name = GEMINI_BACKEND.partition(":")
+    if not class_name:
+        raise GeminiConfigError(f"GEMINI_BACKEND must be 'google' or 'module:ClassName', got {GEMINI_BACKEND!r}")
+    return getattr(importlib.import_module(module_name), class_name)(name, generation_config=generation_config)
+
+
+def warm_up() -> None:
+    """Loads the Gemini SDK ahead of the first request; meant to run in a background thread."""
+    try:
+        gemini_client.get_model()
+    except GeminiConfigError as e:
+        print(f"Gemini not configured: {e}")
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True for errors worth retrying: rate limiting, server errors and dropped connections."""
+    if isinstance(exc, (ConnectionError, asyncio.TimeoutError)):
+        return True
+    code = getattr(exc, "code", None)
+    code = getattr(code, "value", code)
+    if isinstance(code, int) and code in _TRANSIENT_STATUS_CODES:
+        return True
+    # google.api_core errors for gRPC transports carry the status name rather than an HTTP code.
+    return type(exc).__name__ in ("ResourceExhausted", "ServiceUnavailable", "InternalServerError",
+                                  "DeadlineExceeded", "TooManyRequests", "BadGateway", "GatewayTimeout")
+
+
+class TokenBucket:
+    """
+    Requests-per-minute limiter. Each request reserves a token up front (the balance may
+    go negative) and waits until that token has been refilled, so waiters are served in order.
+    Works for both event-loop and thread callers.
+
+    A request with a deadline (max_wait) is refused rather than reserving a token it could
+    only use after the deadline, and a reservation whose wait is cancelled is refunded, so
+    timed-out requests leave no debt behind.
+
+    With a `shared` bucket (SHARED_STATE=db), async callers reserve from it so the quota
+    holds across worker processes; the local bucket then only backs thread callers and
+    covers for the database being unreachable.
+    """
+
+    def __init__(self, per_minute: float = GEMINI_RPM, burst: int = GEMINI_RPM_BURST,
+                 shared: Optional[SharedTokenBucket] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.shared = shared
+        self._clock = clock
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """Takes a token and returns the wait before using it, or None if that wait would exceed max_wait."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def _refund(self) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    async def acquire(self, max_wait: Optional[float] = None) -> float:
+        """Waits for a token; raises RateLimitExceeded at once if none frees up within max_wait seconds."""
+        shared = False
+        wait = None
+        if self.shared is not None:
+            try:
+                wait = await self._reserve_shared(max_wait)
+                shared = True
+            except Exception as e:
+                print(f"Shared rate limit unavailable ({type(e).__name__}: {e}); using this worker's share")
+        if not shared:
+            wait = self._reserve(max_wait)
+        if wait is None:
+            raise RateLimitExceeded(f"No Gemini rate-limit token within {max_wait:.1f}s")
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # The token was never used; give it back so a timed-out caller leaves no debt.
+                if shared:
+                    await self.shared.refund()
+                else:
+                    self._refund()
+                raise
+        return wait
+
+    async def _reserve_shared(self, max_wait: Optional[float]) -> Optional[float]:
+        reservation = asyncio.ensure_future(self.shared.reserve(max_wait))
+        try:
+            return await asyncio.shield(reservation)
+        except asyncio.CancelledError:
+            # The UPDATE may still commit after the caller gave up; return the token it took.
+            try:
+                if await reservation is not None:
+                    await self.shared.refund()
+            except Exception as e:
+                print(f"Could not return a shared rate-limit token ({type(e).__name__}: {e})")
+            raise
+
+    async def available(self) -> float:
+        """Tokens on hand now (negative while callers are waiting); reads the shared row when there is one."""
+        if self.shared is not None:
+            try:
+                return await self.shared.available()
+            except Exception as e:
+                print(f"Shared rate limit unavailable ({type(e).__name__}: {e}); using this worker's share")
+        if self.rate <= 0:
+            return float("inf")
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def acquire_sync(self) -> float:
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def default_rate_limiter() -> TokenBucket:
+    if SHARED_STATE == "db":
+        # The local fallback gets this worker's share of the quota, so the total still holds.
+        return TokenBucket(GEMINI_RPM / MCP_WORKERS, max(1, GEMINI_RPM_BURST // MCP_WORKERS),
+                           shared=SharedTokenBucket("gemini", GEMINI_RPM, GEMINI_RPM_BURST))
+    return TokenBucket()
+
+
+class GeminiClient:
+    """
+    Shared Gemini access for the tracker. Models are built once per (name, generation
+    config) and reused; the SDK keeps one underlying client, so HTTP/gRPC connections
+    are reused across calls too. Every call passes the RPM token bucket, async calls
+    also the concurrency limit, and transient errors are retried with jittered backoff.
+    """
+
+    def __init__(self, model_name: str = GEMINI_MODEL, rate_limiter: Optional[TokenBucket] = None):
+        self.model_name = model_name
+        self.rate_limiter = rate_limiter or default_rate_limiter()
+        self._models: Dict[Tuple[str, Optional[str]], Any] = {}
+        self._semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        self.stats = {"calls": 0, "retries": 0, "errors": 0, "throttled": 0, "throttle_wait_seconds": 0.0,
+                      "rate_limited": 0}
+
+    def get_model(self, model_name: Optional[str] = None, generation_config: Optional[dict] = GENERATION_CONFIG):
+        name = model_name or self.model_name
+        key = (name, repr(sorted(generation_config.items())) if generation_config else None)
+        model = self._models.get(key)
+        if model is None:
+            model = _build_model(name, generation_config)
+            self._models[key] = model
+        return model
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(GEMINI_RETRY_MAX_SECONDS, GEMINI_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    def _record_wait(self, waited: float) -> None:
+        if waited:
+            self.stats["throttled"] += 1
+            self.stats["throttle_wait_seconds"] += waited
+
+    async def generate_async(self, prompt: str, timeout: Optional[float] = None, model_name: Optional[str] = None) -> str:
+        """
+        Returns the response text for one prompt. `timeout` bounds the whole call including
+        retries and rate-limit waits; cancelling the caller cancels the call. Raises
+        RateLimitExceeded (an asyncio.TimeoutError) early when the quota cannot fit the call in time.
+        """
+        timeout = timeout or GEMINI_TIMEOUT_SECONDS
+        deadline = asyncio.get_running_loop().time() + timeout
+        return await asyncio.wait_for(self._generate_with_retry(prompt, model_name, deadline), timeout)
+
+    async def _generate_with_retry(self, prompt: str, model_name: Optional[str], deadline: float) -> str:
+        model = self.get_model(model_name)
+        loop = asyncio.get_running_loop()
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                waited = await self.rate_limiter.acquire(max(0.0, deadline - loop.time()))
+            except RateLimitExceeded:
+                self.stats["rate_limited"] += 1
+                raise
+            self._record_wait(waited)
+            self.stats["calls"] += 1
+            try:
+                async with self._semaphore:
+                    with span("gemini", model_name or self.model_name):
+                        response = await model.generate_content_async(prompt)
+                return response.text
+            except Exception as e:
+                if attempt == GEMINI_MAX_RETRIES or not is_transient(e):
+                    self.stats["errors"] += 1
+                    raise
+                self.stats["retries"] += 1
+                print(f"Gemini call failed ({type(e).__name__}: {e}); retrying")
+                await asyncio.sleep(self._backoff(attempt))
+
+    def generate(self, prompt: str, model_name: Optional[str] = None) -> str:
+        """Blocking version of generate_async for sync callers."""
+        model = self.get_model(model_name)
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            self._record_wait(self.rate_limiter.acquire_sync())
+            self.stats["calls"] += 1
+            try:
+                with span("gemini", model_name or self.model_name):
+                    return model.generate_content(prompt).text
+            except Exception as e:
+                if attempt == GEMINI_MAX_RETRIES or not is_transient(e):
+                    self.stats["errors"] += 1
+                    raise
+                self.stats["retries"] += 1
+                print(f"Gemini call failed ({type(e).__name__}: {e}); retrying")
+                time.sleep(self._backoff(attempt))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "model": self.model_name, "models_built": len(self._models)}
+
+
+gemini_client = GeminiClient()
+register_stats("gemini", gemini_client.get_stats)
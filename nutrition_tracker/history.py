@@ -0,0 +1,135 @@
+"""
+Nutrition log history export.
+
+Rows are read with keyset pagination on (timestamp, id): each page is one short
+query that resumes after the last row of the previous page, using the
+(user_id, timestamp) index. Pages are formatted and handed on before the next one
+is read, so memory use is bounded by the page size rather than by the history size.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+
+from nutrition_tracker.db import AsyncSessionLocal
+from nutrition_tracker.models import User, NutritionLog
+from nutrition_tracker.normalize import NUTRIENT_KEYS
+
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 500))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", 5000))
+EXPORT_FORMATS = ("csv", "ndjson")
+HISTORY_FIELDS = ["id", "timestamp", "food", "amount", *NUTRIENT_KEYS]
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+_COLUMNS = [getattr(NutritionLog, field) for field in HISTORY_FIELDS]
+
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    return f"{timestamp.isoformat()}|{log_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Parses a cursor returned by fetch_history_page; raises ValueError if it is malformed."""
+    timestamp, _, log_id = cursor.rpartition("|")
+    return datetime.fromisoformat(timestamp), int(log_id)
+
+
+def _date_bounds(start_date: Optional[str], end_date: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """YYYY-MM-DD strings to [start, end) datetimes; the end date is inclusive."""
+    start = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+    end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1) if end_date else None
+    return start, end
+
+
+async def _user_pk(user_id: str) -> Optional[int]:
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(select(User.id).where(User.user_id == user_id))).scalar_one_or_none()
+
+
+async def _read_page(
+    user_pk: int, after: Optional[Tuple[datetime, int]], limit: int,
+    start: Optional[datetime], end: Optional[datetime],
+) -> List[Dict[str, Any]]:
+    query = select(*_COLUMNS).where(NutritionLog.user_id == user_pk)
+    if start is not None:
+        query = query.where(NutritionLog.timestamp >= start)
+    if end is not None:
+        query = query.where(NutritionLog.timestamp < end)
+    if after is not None:
+        query = query.where(tuple_(NutritionLog.timestamp, NutritionLog.id) > tuple_(*after))
+    query = query.order_by(NutritionLog.timestamp, NutritionLog.id).limit(limit)
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(query)).all()
+    return [dict(zip(HISTORY_FIELDS, row)) for row in rows]
+
+
+async def fetch_history_page(
+    user_id: str, cursor: Optional[str] = None, limit: int = HISTORY_PAGE_SIZE,
+    start_date: Optional[str] = None, end_date: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Returns up to `limit` log rows after `cursor`, oldest first, and the cursor for the
+    next page (None once the history is exhausted). Raises ValueError on a bad cursor or date.
+    """
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+    start, end = _date_bounds(start_date, end_date)
+    user_pk = await _user_pk(user_id)
+    if user_pk is None:
+        return [], None
+    rows = await _read_page(user_pk, after, limit, start, end)
+    next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"]) if len(rows) == limit else None
+    return rows, next_cursor
+
+
+async def iter_history(
+    user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+    page_size: int = HISTORY_PAGE_SIZE,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yields the user's log rows page by page, oldest first; each page uses its own short session."""
+    start, end = _date_bounds(start_date, end_date)
+    user_pk = await _user_pk(user_id)
+    if user_pk is None:
+        return
+    after = None
+    while True:
+        rows = await _read_page(user_pk, after, page_size, start, end)
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1]["timestamp"], rows[-1]["id"])
+
+
+def format_rows(rows: List[Dict[str, Any]], fmt: str, header: bool = False) -> str:
+    if fmt == "ndjson":
+        return "".join(json.dumps({**r, "timestamp": r["timestamp"].isoformat()}) + "\n" for r in rows)
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    if header:
+        writer.writerow(HISTORY_FIELDS)
+    writer.writerows([r[f].isoformat() if f == "timestamp" else r[f] for f in HISTORY_FIELDS] for r in rows)
+    return out.getvalue()
+
+
+def check_format(fmt: str) -> str:
+    fmt = (fmt or "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}; use one of {', '.join(EXPORT_FORMATS)}")
+    return fmt
+
+
+async def export_history(
+    user_id: str, fmt: str = "csv", start_date: Optional[str] = None, end_date: Optional[str] = None,
+    page_size: int = HISTORY_PAGE_SIZE,
+) -> AsyncIterator[str]:
+    """Streams the user's full history (or a date range) as CSV or NDJSON text chunks, one per page."""
+    fmt = check_format(fmt)
+    if fmt == "csv":
+        yield format_rows([], fmt, header=True)
+    async for rows in iter_history(user_id, start_date, end_date, page_size):
+        yield format_rows(rows, fmt)
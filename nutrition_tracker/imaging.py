@@ -0,0 +1,86 @@
+import io
+import os
+from typing import Optional, Tuple
+
+from PIL import Image, ImageFilter, ImageOps
+
+# Longest side sent to OCR; receipt text stays legible well below phone camera resolution.
+OCR_TARGET_MAX_SIDE = int(os.getenv("OCR_TARGET_MAX_SIDE", "1600"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "75"))
+
+# Receipt detection works on a small thumbnail; a crop is only applied when the
+# detected region is a plausible fraction of the photo.
+_DETECT_SIDE = 256
+_MIN_CROP_FRACTION = 0.15
+_MAX_CROP_FRACTION = 0.95
+_CROP_MARGIN = 0.02
+
+
+def _otsu_threshold(gray: Image.Image) -> int:
+    histogram = gray.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * h for i, h in enumerate(histogram))
+    sum_bg, weight_bg, best, threshold = 0.0, 0, -1.0, 128
+    for i, h in enumerate(histogram):
+        weight_bg += h
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += i * h
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if between > best:
+            best, threshold = between, i
+    return threshold
+
+
+def find_receipt_box(gray: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Returns the bounding box of the bright paper region in a grayscale photo,
+    or None if no plausible receipt region stands out from the background.
+    """
+    small = gray.copy()
+    small.thumbnail((_DETECT_SIDE, _DETECT_SIDE))
+    threshold = _otsu_threshold(small)
+    # Erode the bright mask so specks and glare on the background do not widen the box.
+    mask = small.point(lambda p: 255 if p > threshold else 0).filter(ImageFilter.MinFilter(5))
+    box = mask.getbbox()
+    if not box:
+        return None
+    scale_x, scale_y = gray.width / small.width, gray.height / small.height
+    margin_x, margin_y = gray.width * _CROP_MARGIN, gray.height * _CROP_MARGIN
+    left = max(0, int(box[0] * scale_x - margin_x))
+    top = max(0, int(box[1] * scale_y - margin_y))
+    right = min(gray.width, int(box[2] * scale_x + margin_x))
+    bottom = min(gray.height, int(box[3] * scale_y + margin_y))
+    fraction = (right - left) * (bottom - top) / float(gray.width * gray.height)
+    if not _MIN_CROP_FRACTION <= fraction <= _MAX_CROP_FRACTION:
+        return None
+    return left, top, right, bottom
+
+
+def preprocess_receipt(image_bytes: bytes, max_side: int = OCR_TARGET_MAX_SIDE) -> bytes:
+    """
+    Prepares a receipt photo for OCR: EXIF-rotate, grayscale, crop to the receipt,
+    downscale so the longest side is at most `max_side`, and re-encode as JPEG.
+    Returns the original bytes if the image cannot be decoded or would not get smaller.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image = ImageOps.exif_transpose(image)
+            gray = image.convert("L")
+    except Exception as e:
+        print(f"Could not preprocess receipt image, sending it as-is: {e}")
+        return image_bytes
+    box = find_receipt_box(gray)
+    if box:
+        gray = gray.crop(box)
+    if max(gray.size) > max_side:
+        gray.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    gray.save(out, format="JPEG", quality=OCR_JPEG_QUALITY, optimize=True)
+    processed = out.getvalue()
+    return processed if len(processed) < len(image_bytes) else image_bytes
@@ -0,0 +1,241 @@
+"""
+Low-overhead tracing and metrics, exported in Prometheus text format.
+
+span(kind, name) times a block into a latency histogram (nutrition_span_seconds)
+and counts the block's exceptions (nutrition_span_errors_total). The kinds are
+tool, gemini, ocr, sql, parse and http. Spans opened while a trace is active
+(trace() wraps each MCP tool call) are also collected into that trace. A call
+slower than TRACE_SLOW_MS prints a breakdown of where its time went and is kept
+in recent_slow_traces().
+
+Existing stats dicts (caches, Gemini client, DB pool, write-behind) are registered
+with register_stats() and read only when /metrics is scraped, so their hot paths
+stay unchanged. Set METRICS_ENABLED=0 to turn recording off.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", 1000))
+TRACE_KEEP = int(os.environ.get("TRACE_KEEP", 50))
+# Upper bounds in seconds: sub-millisecond SQL and parsing up to multi-second Gemini/OCR calls.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "nutrition"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        i = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += seconds
+
+
+_histograms: Dict[Tuple[str, str], Histogram] = {}
+_errors: Dict[Tuple[str, str], int] = {}
+_histograms_lock = threading.Lock()
+_stats_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_current_trace: contextvars.ContextVar[Optional[List[Tuple[str, str, float, bool]]]] = contextvars.ContextVar(
+    "nutrition_trace", default=None
+)
+_slow_traces: Deque[Dict[str, Any]] = deque(maxlen=TRACE_KEEP)
+
+
+def record(kind: str, name: str, seconds: float, error: bool = False) -> None:
+    """Records one finished span; spans and the SQL listeners call this."""
+    if not METRICS_ENABLED:
+        return
+    key = (kind, name)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(key, Histogram())
+    histogram.observe(seconds)
+    if error:
+        with _histograms_lock:
+            _errors[key] = _errors.get(key, 0) + 1
+    spans = _current_trace.get()
+    if spans is not None:
+        spans.append((kind, name, seconds, error))
+
+
+class span:
+    """Times a block: `with span("gemini", model_name): ...`. Works around awaits too."""
+
+    __slots__ = ("kind", "name", "started")
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self) -> "span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        record(self.kind, self.name, time.perf_counter() - self.started, exc_type is not None)
+        return False
+
+
+def timed(kind: str, name: Optional[str] = None):
+    """Decorator form of span for plain (sync) functions."""
+    def decorator(fn):
+        label = name or fn.__name__
+
+        def wrapper(*args, **kwargs):
+            with span(kind, label):
+                return fn(*args, **kwargs)
+
+        wrapper.__name__, wrapper.__doc__, wrapper.__wrapped__ = fn.__name__, fn.__doc__, fn
+        return wrapper
+    return decorator
+
+
+class trace:
+    """
+    Root span for one request (an MCP tool call). Collects the spans opened inside it,
+    in this task and the tasks it starts, and reports the call if it was slow.
+    """
+
+    __slots__ = ("kind", "name", "started", "spans", "token")
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self) -> "trace":
+        self.spans = [] if METRICS_ENABLED else None
+        self.token = _current_trace.set(self.spans)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        elapsed = time.perf_counter() - self.started
+        _current_trace.reset(self.token)
+        record(self.kind, self.name, elapsed, exc_type is not None)
+        if self.spans is not None and elapsed * 1000 >= TRACE_SLOW_MS:
+            self._report(elapsed, exc_type)
+        return False
+
+    def _report(self, elapsed: float, exc_type) -> None:
+        by_kind: Dict[str, List[float]] = {}
+        for kind, _, seconds, _ in self.spans:
+            entry = by_kind.setdefault(kind, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+        slow = {
+            "at": time.time(),
+            "span": f"{self.kind}.{self.name}",
+            "ms": round(elapsed * 1000, 1),
+            "error": exc_type.__name__ if exc_type else None,
+            # Nested (ocr.job) and concurrent child spans can add up to more than the wall time.
+            "breakdown": {k: {"count": n, "ms": round(s * 1000, 1)} for k, (n, s) in by_kind.items()},
+            "slowest": [
+                {"span": f"{k}.{n}", "ms": round(s * 1000, 1), "error": e}
+                for k, n, s, e in sorted(self.spans, key=lambda x: x[2], reverse=True)[:5]
+            ],
+        }
+        _slow_traces.append(slow)
+        parts = ", ".join(f"{k} {v['ms']:.0f} ms/{v['count']}" for k, v in slow["breakdown"].items())
+        print(f"Slow {slow['span']}: {slow['ms']:.0f} ms ({parts or 'no child spans'})")
+
+
+def recent_slow_traces() -> List[Dict[str, Any]]:
+    return list(_slow_traces)
+
+
+def register_stats(source: str, fn: Callable[[], Dict[str, Any]]) -> None:
+    """Exports the numeric values of fn() as nutrition_<source>_<key> on every scrape."""
+    _stats_sources[source] = fn
+
+
+# --- Prometheus text format ---
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _metric_name(*parts: str) -> str:
+    name = "_".join(parts)
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+
+
+def render() -> str:
+    lines = [
+        f"# HELP {PREFIX}_span_seconds Latency of traced operations by kind (tool, gemini, ocr, sql, parse, http).",
+        f"# TYPE {PREFIX}_span_seconds histogram",
+    ]
+    for (kind, name), h in sorted(_histograms.items()):
+        with h.lock:
+            counts, total = list(h.counts), h.sum
+        cumulative = 0
+        for bound, count in zip(BUCKETS, counts):
+            cumulative += count
+            lines.append(f"{PREFIX}_span_seconds_bucket{_labels(kind=kind, name=name, le=repr(bound))} {cumulative}")
+        cumulative += counts[-1]
+        lines.append(f"{PREFIX}_span_seconds_bucket{_labels(kind=kind, name=name, le='+Inf')} {cumulative}")
+        lines.append(f"{PREFIX}_span_seconds_sum{_labels(kind=kind, name=name)} {total}")
+        lines.append(f"{PREFIX}_span_seconds_count{_labels(kind=kind, name=name)} {cumulative}")
+    lines += [
+        f"# HELP {PREFIX}_span_errors_total Traced operations that raised.",
+        f"# TYPE {PREFIX}_span_errors_total counter",
+    ]
+    for (kind, name), count in sorted(_errors.items()):
+        lines.append(f"{PREFIX}_span_errors_total{_labels(kind=kind, name=name)} {count}")
+    for source, fn in _stats_sources.items():
+        try:
+            stats = fn()
+        except Exception as e:
+            print(f"Error collecting {source} stats for /metrics: {e}")
+            continue
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric = _metric_name(PREFIX, source, key)
+            lines.append(f"# TYPE {metric} untyped")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(host: str, port: int):
+    """
+    Minimal HTTP listener that answers every request with render(). In multi-worker mode
+    each worker serves its own metrics on its own port (a scrape of the shared port would
+    reach a random worker).
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: " + CONTENT_TYPE.encode()
+                + b"\r\nContent-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
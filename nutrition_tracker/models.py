@@ -1,7 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, Float, DateTime, ForeignKey, UniqueConstraint
-from datetime import datetime
+from sqlalchemy import String, Text, Integer, Float, Date, DateTime, ForeignKey, UniqueConstraint, Index
+from datetime import date, datetime
 from typing import List, Optional
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -18,6 +18,11 @@ class User(Base):
 
 class NutritionLog(Base):
     __tablename__ = "nutrition_log"
+    __table_args__ = (
+        # Per-user history and date-range reads; users.user_id and the per-user
+        # totals/rollup tables are already covered by their unique constraints.
+        Index("ix_nutrition_log_user_timestamp", "user_id", "timestamp"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
     food: Mapped[str] = mapped_column(String, nullable=False)
@@ -41,3 +46,60 @@ class NutritionTotals(Base):
 
     user: Mapped["User"] = relationship("User", back_populates="totals")
 
+
+class NutritionDaily(Base):
+    """Per-user, per-day sums of nutrition_log, kept current on every log insert."""
+    __tablename__ = "nutrition_daily"
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", name="uq_nutrition_daily_user_day"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
+    day: Mapped[date] = mapped_column(Date, nullable=False)
+    calories: Mapped[float] = mapped_column(Float, default=0.0)
+    protein: Mapped[float] = mapped_column(Float, default=0.0)
+    carbs: Mapped[float] = mapped_column(Float, default=0.0)
+    fat: Mapped[float] = mapped_column(Float, default=0.0)
+    entries: Mapped[int] = mapped_column(Integer, default=0)
+
+class NutritionCacheEntry(Base):
+    """Cached Gemini nutrition answer for a normalized (food, unit, amount)."""
+    __tablename__ = "nutrition_cache"
+    __table_args__ = (
+        UniqueConstraint("food", "unit", "amount", name="uq_nutrition_cache_food_unit_amount"),
+        Index("ix_nutrition_cache_food_unit", "food", "unit"),
+        # Purging rows past the TTL (NutritionCache.purge_expired).
+        Index("ix_nutrition_cache_created_at", "created_at"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    food: Mapped[str] = mapped_column(String, nullable=False)
+    unit: Mapped[str] = mapped_column(String, nullable=False)
+    amount: Mapped[float] = mapped_column(Float, nullable=False)
+    calories: Mapped[float] = mapped_column(Float, nullable=False)
+    protein: Mapped[float] = mapped_column(Float, nullable=False)
+    carbs: Mapped[float] = mapped_column(Float, nullable=False)
+    fat: Mapped[float] = mapped_column(Float, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class ScannedBill(Base):
+    """OCR result for a grocery bill image, reused when the same (or a near-identical) photo is sent again."""
+    __tablename__ = "scanned_bills"
+    __table_args__ = (
+        Index("ix_scanned_bills_user_expires", "user_id", "expires_at"),
+        # Purging expired bills (BillCache.purge_expired).
+        Index("ix_scanned_bills_expires", "expires_at"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    content_hash: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    phash: Mapped[str] = mapped_column(String(64), nullable=False)  # "" unless near-duplicate matching is on
+    user_id: Mapped[str] = mapped_column(String, nullable=False)
+    items: Mapped[str] = mapped_column(Text, nullable=False)  # JSON list of item lines
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+class RateLimitBucket(Base):
+    """Token-bucket state shared by all worker processes (see shared_state.SharedTokenBucket)."""
+    __tablename__ = "rate_limit_buckets"
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False)  # Unix time of the last refill
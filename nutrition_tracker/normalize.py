@@ -0,0 +1,47 @@
+import re
+from typing import Tuple
+
+NUTRIENT_KEYS = ("calories", "protein", "carbs", "fat")
+
+# Leading unit words in a food name, mapped to (canonical unit, factor).
+UNIT_ALIASES = {
+    "g": ("g", 1.0), "gm": ("g", 1.0), "gms": ("g", 1.0), "gram": ("g", 1.0), "grams": ("g", 1.0),
+    "kg": ("g", 1000.0), "kgs": ("g", 1000.0), "kilogram": ("g", 1000.0), "kilograms": ("g", 1000.0),
+    "ml": ("ml", 1.0), "millilitre": ("ml", 1.0), "milliliter": ("ml", 1.0), "milliliters": ("ml", 1.0),
+    "l": ("ml", 1000.0), "litre": ("ml", 1000.0), "liter": ("ml", 1000.0), "liters": ("ml", 1000.0),
+    "cup": ("cup", 1.0), "cups": ("cup", 1.0),
+    "tbsp": ("tbsp", 1.0), "tablespoon": ("tbsp", 1.0), "tablespoons": ("tbsp", 1.0),
+    "tsp": ("tsp", 1.0), "teaspoon": ("tsp", 1.0), "teaspoons": ("tsp", 1.0),
+    "slice": ("slice", 1.0), "slices": ("slice", 1.0),
+    "piece": ("piece", 1.0), "pieces": ("piece", 1.0), "pcs": ("piece", 1.0),
+    "bowl": ("bowl", 1.0), "bowls": ("bowl", 1.0),
+}
+DEFAULT_UNIT = "unit"
+
+_UNIT_RE = re.compile(r"^(" + "|".join(sorted(UNIT_ALIASES, key=len, reverse=True)) + r")\b\s*(?:of\s+)?")
+_NON_WORD_RE = re.compile(r"[^a-z0-9 ]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _singular(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        if word.endswith("ies"):
+            return word[:-3] + "y"
+        # tomatoes, potatoes, mangoes
+        return word[:-2] if word.endswith("oes") else word[:-1]
+    return word
+
+
+def normalize_food(food: str, amount: float) -> Tuple[str, float, str]:
+    """
+    Normalizes a food/amount pair into a cache key: (name, amount, unit).
+    "Grams of Rice", 100 -> ("rice", 100.0, "g"); "Eggs", 2 -> ("egg", 2.0, "unit").
+    """
+    name = _SPACE_RE.sub(" ", _NON_WORD_RE.sub(" ", food.lower())).strip()
+    unit, factor = DEFAULT_UNIT, 1.0
+    match = _UNIT_RE.match(name)
+    if match:
+        unit, factor = UNIT_ALIASES[match.group(1)]
+        name = name[match.end():]
+    name = " ".join(_singular(w) for w in name.split())
+    return name, round(float(amount) * factor, 3), unit
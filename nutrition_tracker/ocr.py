@@ -0,0 +1,153 @@
+import asyncio
+import importlib
+import io
+import os
+from typing import List, Optional, Protocol, Tuple
+
+from dotenv import load_dotenv
+
+from nutrition_tracker.metrics import span
+
+load_dotenv()
+
+# Overall deadline for one OCR job (submit + polling) and how many jobs may run at once.
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "30"))
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "4"))
+# Polling starts fast and backs off, since most receipts finish within a couple of seconds.
+OCR_POLL_INITIAL_SECONDS = float(os.getenv("OCR_POLL_INITIAL_SECONDS", "0.25"))
+OCR_POLL_MAX_SECONDS = float(os.getenv("OCR_POLL_MAX_SECONDS", "2"))
+
+# Shrink phone photos (rotate, grayscale, crop, downscale) before upload; see imaging.py.
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# Backend selection: "azure" (default) or "package.module:ClassName" for a custom/stub backend.
+OCR_BACKEND = os.getenv("OCR_BACKEND", "azure")
+
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+# Lines containing any of these are totals, prices, etc. rather than item names.
+NON_ITEM_MARKERS = ["total", "amount", "price", "rs", "$", "qty", "tax"]
+
+
+class OcrError(Exception):
+    pass
+
+
+class OcrBackend(Protocol):
+    """
+    An OCR service with an asynchronous submit/poll API (like Azure Read).
+    poll() returns (status, lines); lines is only set once status is STATUS_SUCCEEDED.
+    """
+
+    async def submit(self, image_bytes: bytes) -> str: ...
+
+    async def poll(self, operation_id: str) -> Tuple[str, Optional[List[str]]]: ...
+
+
+class AzureReadBackend:
+    """
+    Azure AI Vision Read API. The SDK is synchronous, so its calls run in a worker
+    thread; the client (and its HTTP session) is built once and reused.
+    VISION_ENDPOINT may point at a local stub service that speaks the Read API.
+    """
+
+    def __init__(self, endpoint: Optional[str] = None, key: Optional[str] = None):
+        self.endpoint = endpoint or os.environ.get("VISION_ENDPOINT")
+        self.key = key or os.environ.get("VISION_KEY")
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            if not self.key or not self.endpoint:
+                raise OcrError("Azure Vision credentials not set in environment.")
+            from azure.cognitiveservices.vision.computervision import ComputerVisionClient
+            from msrest.authentication import CognitiveServicesCredentials
+            self._client = ComputerVisionClient(self.endpoint, CognitiveServicesCredentials(self.key))
+        return self._client
+
+    async def submit(self, image_bytes: bytes) -> str:
+        client = self._get_client()
+        response = await asyncio.to_thread(client.read_in_stream, io.BytesIO(image_bytes), raw=True)
+        operation_location = response.headers["Operation-Location"]
+        return operation_location.split("/")[-1]
+
+    async def poll(self, operation_id: str) -> Tuple[str, Optional[List[str]]]:
+        from azure.cognitiveservices.vision.computervision.models import OperationStatusCodes
+        result = await asyncio.to_thread(self._get_client().get_read_result, operation_id)
+        if result.status in (OperationStatusCodes.not_started, OperationStatusCodes.running):
+            return STATUS_RUNNING, None
+        if result.status != OperationStatusCodes.succeeded:
+            return STATUS_FAILED, None
+        lines = [line.text for page in result.analyze_result.read_results for line in page.lines]
+        return STATUS_SUCCEEDED, lines
+
+
+_backend: Optional[OcrBackend] = None
+_ocr_semaphore = asyncio.Semaphore(OCR_MAX_CONCURRENCY)
+
+
+def _load_backend(spec: str) -> OcrBackend:
+    if spec == "azure":
+        return AzureReadBackend()
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise OcrError(f"OCR_BACKEND must be 'azure' or 'module:ClassName', got {spec!r}")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def get_ocr_backend() -> OcrBackend:
+    global _backend
+    if _backend is None:
+        _backend = _load_backend(OCR_BACKEND)
+    return _backend
+
+
+def set_ocr_backend(backend: Optional[OcrBackend]) -> None:
+    """Replaces the OCR backend (e.g. with a stub); None reverts to OCR_BACKEND on next use."""
+    global _backend
+    _backend = backend
+
+
+async def read_text_lines(
+    image_bytes: bytes, timeout: Optional[float] = None, preprocess: bool = OCR_PREPROCESS
+) -> List[str]:
+    """
+    Runs one OCR job and returns the recognized text lines.
+    Polls without blocking the event loop, with exponential backoff, under the shared
+    concurrency limit. `timeout` bounds the whole call, including the wait for a slot.
+    Raises OcrError on failure or timeout.
+    """
+    backend = get_ocr_backend()
+    timeout = timeout or OCR_TIMEOUT_SECONDS
+    try:
+        # The deadline covers the whole request: preprocessing, waiting for a
+        # concurrency slot, and the OCR job itself.
+        async with asyncio.timeout(timeout):
+            if preprocess:
+                from nutrition_tracker.imaging import preprocess_receipt
+                with span("ocr", "preprocess"):
+                    image_bytes = await asyncio.to_thread(preprocess_receipt, image_bytes)
+            async with _ocr_semaphore:
+                # "job" covers submit to result, including the sleeps between polls.
+                with span("ocr", "job"):
+                    with span("ocr", "submit"):
+                        operation_id = await backend.submit(image_bytes)
+                    delay = OCR_POLL_INITIAL_SECONDS
+                    while True:
+                        with span("ocr", "poll"):
+                            status, lines = await backend.poll(operation_id)
+                        if status == STATUS_SUCCEEDED:
+                            return lines or []
+                        if status == STATUS_FAILED:
+                            raise OcrError("OCR failed to extract text from image.")
+                        await asyncio.sleep(delay)
+                        delay = min(delay * 2, OCR_POLL_MAX_SECONDS)
+    except TimeoutError:
+        raise OcrError(f"OCR did not finish within {timeout:g} seconds.")
+
+
+def extract_grocery_items(lines: List[str]) -> List[str]:
+    # Simple heuristic: filter out lines that look like totals, prices, etc.
+    return [l for l in lines if l and not any(x in l.lower() for x in NON_ITEM_MARKERS)]
@@ -0,0 +1,184 @@
+"""
+Parsing of Gemini text responses into nutrition dicts and dish lists.
+
+All patterns are compiled once. The common case (JSON mode) is a single json.loads
+on the (fence-stripped) text, with a tolerant fallback that scans for the first JSON
+value and repairs the usual LLM slips (trailing commas, smart quotes, Python
+literals). Keys are normalized from one fixed table, and values such as
+"70 kcal" or null are coerced, so formatting variations no longer fail a call.
+"""
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from nutrition_tracker.metrics import timed
+from nutrition_tracker.normalize import NUTRIENT_KEYS
+
+
+class ResponseParseError(ValueError):
+    pass
+
+
+_START_RE = re.compile(r"[\[{]")
+_TRAILING_COMMA_RE = re.compile(r",\s*([\]}])")
+_PY_LITERAL_RE = re.compile(r"\b(None|True|False)\b")
+_NUMBER_RE = re.compile(r"-?\d{1,3}(?:,\d{3})+(?:\.\d+)?|-?\d+(?:\.\d+)?")
+_KEY_SUFFIX_RE = re.compile(r"\s*\([^)]*\)\s*$|_(?:g|kcal|grams)$|\s+(?:g|kcal|grams|in grams)$")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_PY_LITERALS = {"None": "null", "True": "true", "False": "false"}
+_DECODER = json.JSONDecoder()
+
+# Lower-cased key (unit suffix removed) -> canonical nutrient key.
+KEY_ALIASES = {
+    "calories": "calories", "calorie": "calories", "kcal": "calories", "energy": "calories",
+    "total calories": "calories", "cal": "calories",
+    "protein": "protein", "proteins": "protein", "total protein": "protein",
+    "carbs": "carbs", "carb": "carbs", "carbohydrates": "carbs", "carbohydrate": "carbs",
+    "total carbs": "carbs", "total carbohydrates": "carbs", "net carbs": "carbs",
+    "fat": "fat", "fats": "fat", "total fat": "fat", "total fats": "fat",
+}
+# Keys under which the model sometimes nests the actual answer.
+_WRAPPER_KEYS = ("nutrition", "nutrition_facts", "nutrition facts", "nutrients", "data", "result")
+_DISH_NAME_KEYS = ("name", "dish", "dish_name", "title")
+
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text[:1] in "{[":
+        return text
+    if text.startswith("```"):
+        end = text.rfind("```", 3)
+        text = text[3:end] if end > 0 else text[3:]
+    text = text.strip("` \n")
+    if text[:4].lower() == "json":
+        text = text[4:]
+    return text.strip()
+
+
+def _repair(fragment: str) -> str:
+    fragment = fragment.translate(_SMART_QUOTES)
+    fragment = _TRAILING_COMMA_RE.sub(r"\1", fragment)
+    return _PY_LITERAL_RE.sub(lambda m: _PY_LITERALS[m.group(1)], fragment)
+
+
+def extract_json(text: Optional[str]) -> Any:
+    """
+    Returns the first JSON value in a model response. Tries a direct parse first and
+    then falls back to scanning from each '{' / '[' with light repairs.
+    """
+    if not text:
+        raise ResponseParseError("Empty Gemini response")
+    body = _strip_fences(text)
+    if body[:1] in "{[":
+        try:
+            return json.loads(body)
+        except ValueError:
+            pass
+    first = _START_RE.search(body)
+    if first is None:
+        raise ResponseParseError("No JSON value found in Gemini response")
+    try:
+        return _DECODER.raw_decode(body, first.start())[0]
+    except ValueError:
+        pass
+    body = _repair(body)
+    for match in _START_RE.finditer(body):
+        try:
+            return _DECODER.raw_decode(body, match.start())[0]
+        except ValueError:
+            continue
+    raise ResponseParseError("No JSON value found in Gemini response")
+
+
+@lru_cache(maxsize=512)
+def _canonical_key(key: Any) -> Optional[str]:
+    key = str(key).strip().lower()
+    if key in KEY_ALIASES:
+        return KEY_ALIASES[key]
+    key = _KEY_SUFFIX_RE.sub("", key)
+    return KEY_ALIASES.get(key.replace("_", " ").strip())
+
+
+def _to_float(value: Any) -> float:
+    if type(value) in (int, float):
+        return float(value)
+    if value is None or value == "":
+        return 0.0
+    if isinstance(value, bool):
+        raise ResponseParseError(f"Not a number: {value!r}")
+    if isinstance(value, dict):
+        # e.g. {"value": 6, "unit": "g"}
+        value = value.get("value", value.get("amount"))
+        return _to_float(value)
+    match = _NUMBER_RE.search(str(value))
+    if not match:
+        raise ResponseParseError(f"Not a number: {value!r}")
+    return float(match.group(0).replace(",", ""))
+
+
+def nutrition_from_obj(data: Any) -> Dict[str, float]:
+    """Normalizes one parsed JSON object into {calories, protein, carbs, fat}."""
+    if not isinstance(data, dict):
+        raise ResponseParseError("Nutrition entry is not a JSON object")
+    found: Dict[str, float] = {}
+    for key, value in data.items():
+        canonical = _canonical_key(key)
+        if canonical and canonical not in found:
+            found[canonical] = _to_float(value)
+    missing = [k for k in NUTRIENT_KEYS if k not in found]
+    if missing:
+        for wrapper in _WRAPPER_KEYS:
+            if isinstance(data.get(wrapper), dict):
+                return nutrition_from_obj(data[wrapper])
+        raise ResponseParseError(f"Missing key: {missing[0]}")
+    return {k: found[k] for k in NUTRIENT_KEYS}
+
+
+@timed("parse")
+def parse_nutrition(text: Optional[str]) -> Dict[str, float]:
+    data = extract_json(text)
+    if isinstance(data, list) and len(data) == 1:
+        data = data[0]
+    return nutrition_from_obj(data)
+
+
+@timed("parse")
+def parse_nutrition_list(text: Optional[str], count: int) -> List[Optional[Dict[str, float]]]:
+    """
+    Parses a batch response into one entry per requested item, in request order.
+    Entries may carry a 1-based "index"; entries that are missing or invalid are None.
+    """
+    data = extract_json(text)
+    if isinstance(data, dict):
+        data = next((v for v in data.values() if isinstance(v, list)), None)
+    if not isinstance(data, list):
+        raise ResponseParseError("Response is not a JSON array")
+    results: List[Optional[Dict[str, float]]] = [None] * count
+    for position, entry in enumerate(data):
+        index = entry.get("index", position + 1) if isinstance(entry, dict) else position + 1
+        try:
+            slot = int(index) - 1
+            if 0 <= slot < count and results[slot] is None:
+                results[slot] = nutrition_from_obj(entry)
+        except (TypeError, ValueError) as e:
+            print(f"Skipping invalid batch entry {entry!r}: {e}")
+    return results
+
+
+@timed("parse")
+def parse_string_list(text: Optional[str]) -> List[str]:
+    """Parses a JSON array of strings (or of objects with a name field)."""
+    data = extract_json(text)
+    if isinstance(data, dict):
+        data = next((v for v in data.values() if isinstance(v, list)), None)
+    if not isinstance(data, list):
+        raise ResponseParseError("Response is not a JSON array")
+    names = []
+    for item in data:
+        if isinstance(item, dict):
+            item = next((item[k] for k in _DISH_NAME_KEYS if isinstance(item.get(k), str)), None)
+        if not isinstance(item, str) or not item.strip():
+            raise ResponseParseError("Response is not a list of strings")
+        names.append(item.strip())
+    return names
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import csv
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Any
+
+from nutrition_tracker.normalize import normalize_food, DEFAULT_UNIT, NUTRIENT_KEYS
+from nutrition_tracker.metrics import register_stats
+
+REFERENCE_CSV = os.environ.get(
+    "NUTRITION_REFERENCE_CSV", os.path.join(os.path.dirname(__file__), "data", "nutrition_reference.csv")
+)
+# Minimum name-match confidence (0-1) for answering locally instead of asking Gemini.
+REFERENCE_MIN_CONFIDENCE = float(os.environ.get("NUTRITION_REFERENCE_MIN_CONFIDENCE", "0.8"))
+# A Gemini-answered food joins the index after this many answers (from Gemini or the
+# nutrition cache) that agree per unit.
+REFERENCE_PROMOTE_AFTER = int(os.environ.get("NUTRITION_REFERENCE_PROMOTE_AFTER", "3"))
+REFERENCE_PROMOTE_TOLERANCE = 0.15
+# A bare number at least this large is ambiguous for countable foods: "100 roti" is
+# probably grams, "12 eggs" probably pieces. It is read as grams/ml for foods listed
+# only by weight/volume (e.g. "100 rice") and left to Gemini for foods listed per piece.
+_BARE_AMOUNT_AS_MASS_MIN = 10.0
+_MASS_UNITS = ("g", "ml")
+
+
+def _trigrams(name: str) -> set:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ReferenceIndex:
+    """
+    Compact in-memory nutrition reference.
+
+    Names (canonical foods and aliases) live in one sorted list for prefix search,
+    with a trigram -> name-slot posting list for fuzzy matching. Per-unit nutrient
+    values are stored in one flat array of doubles, four per (food, unit) row.
+    """
+
+    def __init__(self):
+        self._rows: Dict[Tuple[str, str], int] = {}
+        self._values = array("d")
+        self._aliases: Dict[str, str] = {}
+        self._names: List[str] = []
+        self._targets: List[str] = []
+        self._name_trigram_counts = array("H")
+        self._postings: Dict[str, array] = {}
+        self._dirty = False
+        self._observations: Dict[Tuple[str, str], List[Dict[str, float]]] = defaultdict(list)
+        self.stats = {"hits": 0, "low_confidence": 0, "ambiguous": 0, "misses": 0, "promoted": 0}
+
+    def add(self, food: str, unit: str, amount: float, nutrition: Dict[str, float], aliases=()) -> None:
+        name = normalize_food(food, 1)[0]
+        per_unit = [float(nutrition[k]) / amount for k in NUTRIENT_KEYS]
+        key = (name, unit)
+        if key in self._rows:
+            offset = self._rows[key]
+            self._values[offset:offset + 4] = array("d", per_unit)
+        else:
+            self._rows[key] = len(self._values)
+            self._values.extend(per_unit)
+        for alias in (name, *aliases):
+            alias = normalize_food(alias, 1)[0]
+            if alias:
+                self._aliases.setdefault(alias, name)
+        self._dirty = True
+
+    def _build(self) -> None:
+        self._names = sorted(self._aliases)
+        self._targets = [self._aliases[n] for n in self._names]
+        postings = defaultdict(lambda: array("I"))
+        counts = array("H")
+        for slot, name in enumerate(self._names):
+            grams = _trigrams(name)
+            counts.append(len(grams))
+            for gram in grams:
+                postings[gram].append(slot)
+        self._postings = dict(postings)
+        self._name_trigram_counts = counts
+        self._dirty = False
+
+    def match(self, name: str) -> Tuple[Optional[str], float]:
+        """Returns (canonical food, confidence in 0-1) for the best-matching known name."""
+        if self._dirty:
+            self._build()
+        if name in self._aliases:
+            return self._aliases[name], 1.0
+        if not name or not self._names:
+            return None, 0.0
+        query = _trigrams(name)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in query:
+            for slot in self._postings.get(gram, ()):
+                shared[slot] += 1
+        best_slot, best = None, 0.0
+        for slot, count in shared.items():
+            dice = 2.0 * count / (len(query) + self._name_trigram_counts[slot])
+            if dice > best:
+                best_slot, best = slot, dice
+        # A query that is a prefix of a known name ("chick" -> "chickpea") scores by coverage.
+        slot = bisect_left(self._names, name)
+        if slot < len(self._names) and self._names[slot].startswith(name):
+            coverage = len(name) / len(self._names[slot])
+            if coverage > best:
+                best_slot, best = slot, coverage
+        if best_slot is None:
+            return None, 0.0
+        return self._targets[best_slot], best
+
+    def lookup(self, food: str, amount: float) -> Optional[Dict[str, Any]]:
+        """
+        Answers a food/amount from the index, or returns None when the food is unknown,
+        the match is below REFERENCE_MIN_CONFIDENCE, the unit is not listed for it, or
+        the amount is a large bare number for a countable food.
+        """
+        name, qty, unit = normalize_food(food, amount)
+        if qty <= 0:
+            return None
+        target, confidence = self.match(name)
+        if target is None:
+            self.stats["misses"] += 1
+            return None
+        if confidence < REFERENCE_MIN_CONFIDENCE:
+            self.stats["low_confidence"] += 1
+            return None
+        offset = self._rows.get((target, unit))
+        if unit == DEFAULT_UNIT and qty >= _BARE_AMOUNT_AS_MASS_MIN:
+            if offset is not None:
+                self.stats["ambiguous"] += 1
+                return None
+            offset = next((self._rows[(target, u)] for u in _MASS_UNITS if (target, u) in self._rows), None)
+        if offset is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        nutrition = {k: round(self._values[offset + i] * qty, 2) for i, k in enumerate(NUTRIENT_KEYS)}
+        return {"nutrition": nutrition, "food": target, "confidence": round(confidence, 3)}
+
+    def observe(self, food: str, amount: float, nutrition: Dict[str, float]) -> bool:
+        """
+        Records an answer from Gemini or the nutrition cache. Once REFERENCE_PROMOTE_AFTER
+        answers for the same food/unit agree per unit (calories within 15% of their mean), the
+        food is promoted into the index. Counts are per process; after a restart the cache
+        hits (its database tier persists) rebuild them. Returns True when this call promoted the food.
+        """
+        name, qty, unit = normalize_food(food, amount)
+        if not name or qty <= 0 or (name, unit) in self._rows:
+            return False
+        if unit == DEFAULT_UNIT and qty >= _BARE_AMOUNT_AS_MASS_MIN:
+            # Pieces or grams is unknown, so the answer says nothing reliable per piece.
+            return False
+        seen = self._observations[(name, unit)]
+        seen.append({k: float(nutrition[k]) / qty for k in NUTRIENT_KEYS})
+        if len(seen) < REFERENCE_PROMOTE_AFTER:
+            return False
+        mean = {k: sum(p[k] for p in seen) / len(seen) for k in NUTRIENT_KEYS}
+        if mean["calories"] <= 0 or any(
+            abs(p["calories"] - mean["calories"]) > REFERENCE_PROMOTE_TOLERANCE * mean["calories"] for p in seen
+        ):
+            del seen[0]
+            return False
+        self.add(name, unit, 1.0, mean)
+        del self._observations[(name, unit)]
+        self.stats["promoted"] += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "foods": len(self._rows), "names": len(self._aliases)}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def load_reference_index(path: str = REFERENCE_CSV) -> ReferenceIndex:
+    index = ReferenceIndex()
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                aliases = [a for a in (row.get("aliases") or "").split("|") if a]
+                index.add(row["food"], row["unit"], float(row["amount"]), row, aliases)
+    except FileNotFoundError:
+        print(f"Nutrition reference file not found: {path}")
+    return index
+
+
+reference_index = load_reference_index()
+register_stats("reference", reference_index.get_stats)
+
+
+# --- Promotion candidates from the nutrition cache ---
+async def promotion_candidates(min_count: int = REFERENCE_PROMOTE_AFTER) -> List[Dict[str, Any]]:
+    """
+    Returns foods in the nutrition_cache table that Gemini answered at least `min_count`
+    times with consistent per-unit calories and that the reference does not know yet,
+    as rows in the reference CSV format (per one unit).
+    """
+    from sqlalchemy import select
+    from nutrition_tracker.db import AsyncSessionLocal
+    from nutrition_tracker.models import NutritionCacheEntry
+
+    async with AsyncSessionLocal() as session:
+        entries = (await session.execute(select(NutritionCacheEntry))).scalars().all()
+    grouped = defaultdict(list)
+    for e in entries:
+        if e.amount > 0:
+            grouped[(e.food, e.unit)].append({k: getattr(e, k) / e.amount for k in NUTRIENT_KEYS})
+    candidates = []
+    for (food, unit), profiles in sorted(grouped.items()):
+        if len(profiles) < min_count or reference_index.match(food)[1] >= REFERENCE_MIN_CONFIDENCE:
+            continue
+        mean = {k: sum(p[k] for p in profiles) / len(profiles) for k in NUTRIENT_KEYS}
+        if mean["calories"] <= 0 or any(
+            abs(p["calories"] - mean["calories"]) > REFERENCE_PROMOTE_TOLERANCE * mean["calories"] for p in profiles
+        ):
+            continue
+        candidates.append({"food": food, "aliases": "", "unit": unit, "amount": 1,
+                           **{k: round(v, 3) for k, v in mean.items()}})
+    return candidates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print nutrition_cache foods that are consistent enough to add to the reference CSV."
+    )
+    parser.add_argument("--min-count", type=int, default=REFERENCE_PROMOTE_AFTER)
+    args = parser.parse_args()
+    rows = asyncio.run(promotion_candidates(args.min_count))
+    writer = csv.DictWriter(sys.stdout, fieldnames=["food", "aliases", "unit", "amount", *NUTRIENT_KEYS])
+    writer.writerows(rows)
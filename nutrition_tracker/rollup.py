@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import sys
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nutrition_tracker.db import AsyncSessionLocal, dialect_insert
+from nutrition_tracker.models import User, NutritionLog, NutritionDaily
+
+NUTRIENT_KEYS = ("calories", "protein", "carbs", "fat")
+
+# Sums are floats, so the consistency check allows for rounding differences.
+TOLERANCE = 1e-6
+
+
+def _as_date(value) -> date:
+    # func.date() gives a date on PostgreSQL and an ISO string on SQLite.
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), "%Y-%m-%d").date()
+
+
+async def add_to_daily_rollup(
+    session: AsyncSession, user_pk: int, day: date, nutrition: Dict[str, float], entries: int = 1
+) -> None:
+    """
+    Adds logged entries (one by default; `nutrition` is their sum) to the user's nutrition_daily
+    row for `day` with a single atomic upsert. Runs in the caller's session so the rollup
+    commits with the NutritionLog insert.
+    """
+    stmt = dialect_insert(NutritionDaily).values(
+        user_id=user_pk, day=day, entries=entries, **{k: nutrition[k] for k in NUTRIENT_KEYS}
+    )
+    set_ = {k: func.coalesce(getattr(NutritionDaily, k), 0.0) + getattr(stmt.excluded, k) for k in NUTRIENT_KEYS}
+    set_["entries"] = func.coalesce(NutritionDaily.entries, 0) + stmt.excluded.entries
+    await session.execute(stmt.on_conflict_do_update(index_elements=["user_id", "day"], set_=set_))
+
+
+def _aggregate_logs_query(user_pk: Optional[int] = None):
+    day = func.date(NutritionLog.timestamp)
+    query = select(
+        NutritionLog.user_id,
+        day.label("day"),
+        func.sum(NutritionLog.calories).label("calories"),
+        func.sum(NutritionLog.protein).label("protein"),
+        func.sum(NutritionLog.carbs).label("carbs"),
+        func.sum(NutritionLog.fat).label("fat"),
+        func.count(NutritionLog.id).label("entries"),
+    )
+    if user_pk is not None:
+        query = query.where(NutritionLog.user_id == user_pk)
+    return query.group_by(NutritionLog.user_id, day)
+
+
+async def _resolve_user_pk(session: AsyncSession, user_id: Optional[str]) -> Optional[int]:
+    if user_id is None:
+        return None
+    user = (await session.execute(select(User).where(User.user_id == user_id))).scalar_one_or_none()
+    if not user:
+        raise ValueError(f"Unknown user: {user_id}")
+    return user.id
+
+
+async def rebuild_daily_rollup(user_id: Optional[str] = None) -> int:
+    """
+    Rebuilds nutrition_daily from nutrition_log, for one user or for everyone.
+    Use it to backfill existing data or to repair drift. Returns the number of rows written.
+    """
+    async with AsyncSessionLocal() as session:
+        user_pk = await _resolve_user_pk(session, user_id)
+        stmt = delete(NutritionDaily)
+        if user_pk is not None:
+            stmt = stmt.where(NutritionDaily.user_id == user_pk)
+        await session.execute(stmt)
+        rows = (await session.execute(_aggregate_logs_query(user_pk))).fetchall()
+        session.add_all(
+            NutritionDaily(
+                user_id=row.user_id,
+                day=_as_date(row.day),
+                calories=float(row.calories or 0),
+                protein=float(row.protein or 0),
+                carbs=float(row.carbs or 0),
+                fat=float(row.fat or 0),
+                entries=row.entries,
+            )
+            for row in rows
+        )
+        await session.commit()
+        return len(rows)
+
+
+async def check_daily_rollup(user_id: Optional[str] = None) -> List[dict]:
+    """
+    Compares nutrition_daily against a fresh aggregate of nutrition_log.
+    Returns one item per (user, day) that differs; an empty list means the rollup is consistent.
+    """
+    async with AsyncSessionLocal() as session:
+        user_pk = await _resolve_user_pk(session, user_id)
+        expected = {
+            (row.user_id, _as_date(row.day)): row
+            for row in (await session.execute(_aggregate_logs_query(user_pk))).fetchall()
+        }
+        query = select(NutritionDaily)
+        if user_pk is not None:
+            query = query.where(NutritionDaily.user_id == user_pk)
+        actual = {(d.user_id, d.day): d for d in (await session.execute(query)).scalars()}
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want, have = expected.get(key), actual.get(key)
+        diffs = {}
+        for k in NUTRIENT_KEYS + ("entries",):
+            w = float(getattr(want, k) or 0) if want is not None else 0.0
+            h = float(getattr(have, k) or 0) if have is not None else 0.0
+            if abs(w - h) > TOLERANCE:
+                diffs[k] = {"expected": w, "actual": h}
+        if diffs:
+            mismatches.append({"user_pk": key[0], "day": key[1].isoformat(), "diffs": diffs})
+    return mismatches
+
+
+async def _main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the nutrition_daily rollup table.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--user-id", help="Only process this user (default: all users)")
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        count = await rebuild_daily_rollup(args.user_id)
+        print(f"Rebuilt nutrition_daily: {count} rows.")
+        return 0
+    mismatches = await check_daily_rollup(args.user_id)
+    for m in mismatches:
+        print(f"user {m['user_pk']} {m['day']}: {m['diffs']}")
+    print("nutrition_daily is consistent." if not mismatches else f"{len(mismatches)} inconsistent rows.")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,123 @@
+"""
+State that must stay correct when several worker processes serve the same app.
+
+SHARED_STATE selects where it lives: "memory" (one process; the default) or "db"
+(every worker sees the same state through the database; the default when
+MCP_WORKERS > 1). In "db" mode:
+
+- the Gemini requests-per-minute quota is one SharedTokenBucket row for all workers
+  instead of one in-process bucket per worker;
+- the trend cache keys results on the user's rollup entry count (data_version), so a
+  log written by any worker makes every worker's cached trends for that user stale.
+
+The nutrition and bill caches need nothing extra: their in-process tier only holds
+answers that do not change, and their second tier is already the database.
+"""
+import os
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import func, select, update
+
+from nutrition_tracker.db import AsyncSessionLocal, dialect_insert, get_engine
+from nutrition_tracker.models import RateLimitBucket, User, NutritionDaily
+
+MCP_WORKERS = int(os.environ.get("MCP_WORKERS", 1))
+SHARED_STATE = os.environ.get("SHARED_STATE") or ("db" if MCP_WORKERS > 1 else "memory")
+if SHARED_STATE not in ("memory", "db"):
+    raise ValueError(f"SHARED_STATE must be 'memory' or 'db', got {SHARED_STATE!r}")
+
+
+def _least(a, b):
+    return func.least(a, b) if get_engine().dialect.name == "postgresql" else func.min(a, b)
+
+
+def _greatest(a, b):
+    return func.greatest(a, b) if get_engine().dialect.name == "postgresql" else func.max(a, b)
+
+
+class SharedTokenBucket:
+    """
+    Requests-per-minute limiter whose state is one rate_limit_buckets row, so the quota
+    holds across worker processes. Same reservation scheme as gemini.TokenBucket: each
+    request takes a token with one atomic UPDATE ... RETURNING (the balance may go
+    negative) and sleeps until that token has been refilled. A request with a deadline
+    leaves the row untouched when its token would come too late, and refund() returns
+    a token whose wait was cancelled.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: int, clock: Callable[[], float] = time.time):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._clock = clock
+        self._created = False
+
+    async def _ensure_row(self, session) -> None:
+        await session.execute(
+            dialect_insert(RateLimitBucket)
+            .values(name=self.name, tokens=float(self.capacity), updated_at=self._clock())
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+        self._created = True
+
+    async def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Takes one token and returns how long to wait before using it, or returns None
+        without taking one if that wait would exceed max_wait.
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = self._clock()
+        async with AsyncSessionLocal() as session:
+            if not self._created:
+                await self._ensure_row(session)
+            # Clocks of different workers may disagree slightly; never refill a negative interval.
+            elapsed = _greatest(0.0, now - RateLimitBucket.updated_at)
+            remaining = _least(float(self.capacity), RateLimitBucket.tokens + elapsed * self.rate) - 1
+            stmt = update(RateLimitBucket).where(RateLimitBucket.name == self.name)
+            if max_wait is not None:
+                stmt = stmt.where(remaining >= -max_wait * self.rate)
+            tokens = (await session.execute(
+                stmt.values(tokens=remaining, updated_at=_greatest(RateLimitBucket.updated_at, now))
+                .returning(RateLimitBucket.tokens)
+            )).scalar_one_or_none()
+            await session.commit()
+        if tokens is None:
+            return None
+        return max(0.0, -tokens / self.rate)
+
+    async def available(self) -> float:
+        """Tokens on hand now, without taking one."""
+        if self.rate <= 0:
+            return float("inf")
+        async with AsyncSessionLocal() as session:
+            row = await session.get(RateLimitBucket, self.name)
+        if row is None:
+            return float(self.capacity)
+        return min(self.capacity, row.tokens + max(0.0, self._clock() - row.updated_at) * self.rate)
+
+    async def refund(self) -> None:
+        """Returns a reserved token that was never used."""
+        if self.rate <= 0:
+            return
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(RateLimitBucket)
+                .where(RateLimitBucket.name == self.name)
+                .values(tokens=_least(float(self.capacity), RateLimitBucket.tokens + 1))
+            )
+            await session.commit()
+
+
+async def data_version(user_id: str) -> Optional[int]:
+    """
+    Number of log entries the user's daily rollup has absorbed. Every write path adds to
+    it in the same transaction as the log rows, so it changes whenever the user's data does.
+    """
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(
+            select(func.coalesce(func.sum(NutritionDaily.entries), 0))
+            .join(User, User.id == NutritionDaily.user_id)
+            .where(User.user_id == user_id)
+        )).scalar_one()
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent async calls by key: while a call for a key is in flight,
+    later callers with the same key await the same task instead of starting their own.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {"calls": 0, "executed": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["executed"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # Shield so one cancelled caller does not cancel the call shared with the others.
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every waiter was cancelled.
+            task.exception()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": len(self._inflight)}
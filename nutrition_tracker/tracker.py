@@ -1,17 +1,10 @@
 import os
-import json
-from typing import Optional, Dict, List, Any
-import google.generativeai as genai
+from typing import Optional, Dict, List, Set, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY not set in environment.")
-
-genai.configure(api_key=GEMINI_API_KEY)
+from nutrition_tracker.gemini import gemini_client, GeminiConfigError
 
 PROMPT_TEMPLATE = (
     "Give me the nutrition facts for {amount} {food}. "
@@ -20,64 +13,233 @@ PROMPT_TEMPLATE = (
     "Only return the JSON object."
 )
 
-import re
+import asyncio
+from nutrition_tracker.reference import reference_index
+from nutrition_tracker.parsing import parse_nutrition, parse_nutrition_list, parse_string_list
+
+def lookup_reference_nutrition(food: str, amount: float) -> Optional[Dict[str, float]]:
+    """
+    Answers staple foods from the local reference index (no network) when the name
+    match is confident enough; returns None for unknown or ambiguous foods.
+    """
+    match = reference_index.lookup(food, amount)
+    return match["nutrition"] if match else None
 
 def get_nutrition_from_gemini(food: str, amount: float) -> Optional[Dict[str, float]]:
+    local = lookup_reference_nutrition(food, amount)
+    if local:
+        return local
     prompt = PROMPT_TEMPLATE.format(food=food, amount=amount)
-    model = genai.GenerativeModel("gemini-1.5-flash")
     text = None
     try:
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        # Remove code block markers and leading 'json'
-        text = text.lstrip("` \n")
-        if text.lower().startswith("json"):
-            text = text[4:].lstrip(" \n")
-        # Extract the first JSON object from the response
-        match = re.search(r'\{.*?\}', text, re.DOTALL)
-        if not match:
-            raise ValueError("No JSON object found in Gemini response")
-        json_str = match.group(0)
-        data = json.loads(json_str)
-        # Normalize keys
-        key_map = {
-            "protein (g)": "protein",
-            "carbs (g)": "carbs",
-            "fat (g)": "fat",
-            "protein_g": "protein",
-            "carbs_g": "carbs",
-            "fat_g": "fat",
-        }
-        for old, new in key_map.items():
-            if old in data:
-                data[new] = data.pop(old)
-        # Ensure all required keys are present
-        for key in ("calories", "protein", "carbs", "fat"):
-            if key not in data:
-                raise ValueError(f"Missing key: {key}")
-        # Coerce any None or missing values to 0 as a fallback
-        return {
-            "calories": float(data["calories"]), 
-            "protein": float(data["protein"]), 
-            "carbs": float(data["carbs"]) ,
-            "fat": float(data["fat"]), 
-        }
+        text = gemini_client.generate(prompt)
+        return parse_nutrition(text)
+    except GeminiConfigError:
+        raise
     except Exception as e:
         print(f"Error parsing Gemini nutrition response: {e}\nRaw response: {text}")
         return None
 
-# --- Nutrition Totals from DB ---
-from nutrition_tracker.db import AsyncSessionLocal
-from nutrition_tracker.models import User, NutritionLog
+async def get_nutrition_from_gemini_async(
+    food: str, amount: float, timeout: Optional[float] = None
+) -> Optional[Dict[str, float]]:
+    """
+    Non-blocking version of get_nutrition_from_gemini for the async MCP tools.
+    Returns None on timeout or parse failure; cancellation propagates to the caller.
+    """
+    local = lookup_reference_nutrition(food, amount)
+    if local:
+        return local
+    prompt = PROMPT_TEMPLATE.format(food=food, amount=amount)
+    text = None
+    try:
+        text = await gemini_client.generate_async(prompt, timeout)
+        return parse_nutrition(text)
+    except asyncio.TimeoutError:
+        print(f"Gemini nutrition request timed out for {amount} {food}")
+        return None
+    except GeminiConfigError:
+        raise
+    except Exception as e:
+        print(f"Error parsing Gemini nutrition response: {e}\nRaw response: {text}")
+        return None
+
+# --- Cached Nutrition Lookup ---
+from nutrition_tracker.cache import nutrition_cache, normalize_food
+from nutrition_tracker.singleflight import SingleFlight
+from nutrition_tracker.metrics import register_stats
+
+# Concurrent cache misses for the same normalized food/amount share one Gemini call.
+nutrition_flight = SingleFlight()
+register_stats("coalescing", nutrition_flight.get_stats)
+
+async def _fetch_and_cache_nutrition(food: str, amount: float) -> Optional[Dict[str, float]]:
+    nutrition = await get_nutrition_from_gemini_async(food, amount)
+    if nutrition:
+        await nutrition_cache.put(food, amount, nutrition)
+        # Foods Gemini answers consistently are promoted into the local reference index.
+        reference_index.observe(food, amount, nutrition)
+    return nutrition
+
+async def lookup_cached_nutrition(food: str, amount: float) -> Optional[Dict[str, float]]:
+    """
+    Nutrition cache lookup. A hit also counts toward promoting the food into the reference
+    index: after the first Gemini answer the cache serves every later amount of that food,
+    so the hits are what shows a food is asked for often enough to keep locally.
+    """
+    nutrition = await nutrition_cache.get(food, amount)
+    if nutrition is not None:
+        reference_index.observe(food, amount, nutrition)
+    return nutrition
+
+async def get_nutrition_cached(food: str, amount: float) -> Optional[Dict[str, float]]:
+    """
+    Returns nutrition for the food/amount, answering from the nutrition cache when possible
+    (exact entry or a scaled per-unit profile) and falling back to Gemini on a miss.
+    Identical lookups that miss at the same time are coalesced into one Gemini call.
+    Staple foods in the local reference index are answered before either.
+    """
+    nutrition = lookup_reference_nutrition(food, amount)
+    if nutrition is not None:
+        return nutrition
+    nutrition = await lookup_cached_nutrition(food, amount)
+    if nutrition is not None:
+        return nutrition
+    nutrition = await nutrition_flight.do(
+        normalize_food(food, amount), lambda: _fetch_and_cache_nutrition(food, amount)
+    )
+    return dict(nutrition) if nutrition else None
+
+# --- Batched Nutrition Lookup ---
+BATCH_PROMPT_TEMPLATE = (
+    "Give me the nutrition facts for each of these foods:\n{items}\n"
+    "Return a JSON array with one object per food, in the same order, each with the keys "
+    "index (the number shown above), calories, protein (g), carbs (g), and fat (g) as numbers. "
+    "If you cannot determine a value for any field, return 0 for that field (do not use null, empty, or omit the field). "
+    "Only return the JSON array."
+)
+
+async def get_nutrition_batch(items: List[Tuple[str, float]]) -> List[Optional[Dict[str, float]]]:
+    """
+    Resolves several (food, amount) pairs together. Reference and cached items are answered locally,
+    the rest go to Gemini in one structured prompt. Any item the batch response does not
+    answer validly falls back to its own get_nutrition_cached lookup.
+    Returns one entry per input item, in order (None where nothing could be found).
+    """
+    results: List[Optional[Dict[str, float]]] = [lookup_reference_nutrition(f, a) for f, a in items]
+    # Cache lookups (which may each go to the database) run concurrently.
+    uncached = [i for i, r in enumerate(results) if r is None]
+    for i, nutrition in zip(uncached, await asyncio.gather(*(lookup_cached_nutrition(*items[i]) for i in uncached))):
+        results[i] = nutrition
+    missing = [i for i, r in enumerate(results) if r is None]
+    if len(missing) > 1:
+        listing = "\n".join(f"{n}. {items[i][1]} {items[i][0]}" for n, i in enumerate(missing, start=1))
+        text = None
+        try:
+            text = await gemini_client.generate_async(BATCH_PROMPT_TEMPLATE.format(items=listing))
+            for i, nutrition in zip(missing, parse_nutrition_list(text, len(missing))):
+                if nutrition:
+                    results[i] = nutrition
+                    await nutrition_cache.put(items[i][0], items[i][1], nutrition)
+                    reference_index.observe(items[i][0], items[i][1], nutrition)
+        except asyncio.TimeoutError:
+            print(f"Gemini batch nutrition request timed out for {len(missing)} items")
+        except GeminiConfigError:
+            raise
+        except Exception as e:
+            print(f"Error parsing Gemini batch nutrition response: {e}\nRaw response: {text}")
+    fallback = [i for i in missing if results[i] is None]
+    if fallback:
+        resolved = await asyncio.gather(*(get_nutrition_cached(*items[i]) for i in fallback))
+        for i, nutrition in zip(fallback, resolved):
+            results[i] = nutrition
+    return results
+
+# --- Nutrition Logging to DB ---
+from nutrition_tracker.db import AsyncSessionLocal, dialect_insert
+from nutrition_tracker.models import User, NutritionLog, NutritionTotals, NutritionDaily
+from nutrition_tracker.rollup import add_to_daily_rollup
+from nutrition_tracker.analytics import trend_cache
 from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
+async def upsert_user(session: AsyncSession, user_id: str) -> int:
+    """
+    Gets or creates the user in one statement and returns its primary key.
+    The no-op DO UPDATE makes RETURNING yield the existing row on conflict.
+    """
+    stmt = dialect_insert(User).values(user_id=user_id)
+    stmt = stmt.on_conflict_do_update(index_elements=["user_id"], set_={"user_id": stmt.excluded.user_id})
+    return (await session.execute(stmt.returning(User.id))).scalar_one()
+
+async def add_to_totals(session: AsyncSession, user_pk: int, nutrition: Dict[str, float]) -> None:
+    """
+    Adds to the user's running totals with one atomic INSERT ... ON CONFLICT DO UPDATE,
+    so concurrent logs for the same user cannot lose updates.
+    """
+    stmt = dialect_insert(NutritionTotals).values(
+        user_id=user_pk, **{k: nutrition[k] for k in ("calories", "protein", "carbs", "fat")}
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            k: func.coalesce(getattr(NutritionTotals, k), 0.0) + getattr(stmt.excluded, k)
+            for k in ("calories", "protein", "carbs", "fat")
+        },
+    )
+    await session.execute(stmt)
+
+async def log_nutrition_to_db(
+    user_id: str, food: str, amount: float, nutrition: Dict[str, float], timestamp: Optional[datetime] = None
+) -> NutritionLog:
+    """
+    Inserts one nutrition_log row for the user and, in the same transaction,
+    adds it to the user's running totals and to the nutrition_daily rollup.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    async with AsyncSessionLocal() as session:
+        user_pk = await upsert_user(session, user_id)
+        log = NutritionLog(user_id=user_pk, food=food, amount=amount, timestamp=timestamp, calories=nutrition['calories'], protein=nutrition['protein'], carbs=nutrition['carbs'], fat=nutrition['fat'])
+        session.add(log)
+        await add_to_totals(session, user_pk, nutrition)
+        await add_to_daily_rollup(session, user_pk, timestamp.date(), nutrition)
+        await session.commit()
+    trend_cache.invalidate(user_id)
+    return log
+
+async def log_nutrition_batch_to_db(
+    user_id: str, entries: List[Tuple[str, float, Dict[str, float]]], timestamp: Optional[datetime] = None
+) -> List[NutritionLog]:
+    """
+    Inserts several (food, amount, nutrition) entries for one user in a single transaction,
+    with one totals upsert and one daily rollup upsert for the whole batch.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    if not entries:
+        return []
+    summed = {k: sum(float(n[k]) for _, _, n in entries) for k in ("calories", "protein", "carbs", "fat")}
+    async with AsyncSessionLocal() as session:
+        user_pk = await upsert_user(session, user_id)
+        logs = [
+            NutritionLog(user_id=user_pk, food=food, amount=amount, timestamp=timestamp, calories=n['calories'], protein=n['protein'], carbs=n['carbs'], fat=n['fat'])
+            for food, amount, n in entries
+        ]
+        session.add_all(logs)
+        await add_to_totals(session, user_pk, summed)
+        await add_to_daily_rollup(session, user_pk, timestamp.date(), summed, entries=len(entries))
+        await session.commit()
+    trend_cache.invalidate(user_id)
+    return logs
+
+# --- Nutrition Totals from DB ---
 async def get_nutrition_totals_from_db(
     user_id: str, start_date: str = None, end_date: str = None
 ) -> list[dict]:
     """
     Returns a list of daily nutrition totals for the user from the database.
     Each item: { "date": "YYYY-MM-DD", "calories": float, "protein": float, "carbs": float, "fat": float }
+    Reads the nutrition_daily rollup, so the cost depends on the date range, not on the history size.
     """
     async with AsyncSessionLocal() as session:
         # Get user row
@@ -86,40 +248,29 @@ async def get_nutrition_totals_from_db(
             return []
 
         # Build query
-        query = (
-            select(
-                func.date(NutritionLog.timestamp).label("date"),
-                func.sum(NutritionLog.calories).label("calories"),
-                func.sum(NutritionLog.protein).label("protein"),
-                func.sum(NutritionLog.carbs).label("carbs"),
-                func.sum(NutritionLog.fat).label("fat"),
-            )
-            .where(NutritionLog.user_id == user.id)
-        )
+        query = select(NutritionDaily).where(NutritionDaily.user_id == user.id)
 
         # Date filtering
         if start_date:
             try:
-                start = datetime.strptime(start_date, "%Y-%m-%d")
-                query = query.where(NutritionLog.timestamp >= start)
+                start = datetime.strptime(start_date, "%Y-%m-%d").date()
+                query = query.where(NutritionDaily.day >= start)
             except Exception:
                 pass
         if end_date:
             try:
-                end = datetime.strptime(end_date, "%Y-%m-%d")
-                # Add 1 day to include the end date fully
-                end = end.replace(hour=23, minute=59, second=59)
-                query = query.where(NutritionLog.timestamp <= end)
+                end = datetime.strptime(end_date, "%Y-%m-%d").date()
+                query = query.where(NutritionDaily.day <= end)
             except Exception:
                 pass
 
-        query = query.group_by(func.date(NutritionLog.timestamp)).order_by(func.date(NutritionLog.timestamp))
+        query = query.order_by(NutritionDaily.day)
 
         result = await session.execute(query)
-        rows = result.fetchall()
+        rows = result.scalars().all()
         return [
             {
-                "date": str(row.date),
+                "date": row.day.isoformat(),
                 "calories": float(row.calories or 0),
                 "protein": float(row.protein or 0),
                 "carbs": float(row.carbs or 0),
@@ -129,28 +280,109 @@ async def get_nutrition_totals_from_db(
         ]
 
 # --- Dish Suggestion via Gemini ---
+DISH_PROMPT_TEMPLATE = (
+    "You are a helpful kitchen assistant. Suggest 3 creative, healthy dish names using ONLY these ingredients: "
+    "{ingredients}. "
+    "Return a JSON array of 3 dish names (strings). Do not include any text or explanation, only the JSON array."
+)
+
 def suggest_dishes_from_gemini(ingredients: List[str]) -> Optional[List[str]]:
-    prompt = (
-        "You are a helpful kitchen assistant. Suggest 3 creative, healthy dish names using ONLY these ingredients: "
-        f"{', '.join(ingredients)}. "
-        "Return a JSON array of 3 dish names (strings). Do not include any text or explanation, only the JSON array."
-    )
-    model = genai.GenerativeModel("gemini-1.5-flash")
+    prompt = DISH_PROMPT_TEMPLATE.format(ingredients=", ".join(ingredients))
+    text = None
+    try:
+        text = gemini_client.generate(prompt)
+        return parse_string_list(text)
+    except GeminiConfigError:
+        raise
+    except Exception as e:
+        print(f"Error parsing Gemini dish suggestion response: {e}\nRaw response: {text}")
+        return None
+
+async def suggest_dishes_from_gemini_async(
+    ingredients: List[str], timeout: Optional[float] = None
+) -> Optional[List[str]]:
+    """
+    Non-blocking version of suggest_dishes_from_gemini for the async MCP tools.
+    """
+    prompt = DISH_PROMPT_TEMPLATE.format(ingredients=", ".join(ingredients))
     text = None
     try:
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        text = text.lstrip("` \n")
-        if text.lower().startswith("json"):
-            text = text[4:].lstrip(" \n")
-        match = re.search(r'\[.*\]', text, re.DOTALL)
-        if not match:
-            raise ValueError("No JSON array found in Gemini response")
-        json_str = match.group(0)
-        data = json.loads(json_str)
-        if not isinstance(data, list) or not all(isinstance(d, str) for d in data):
-            raise ValueError("Response is not a list of strings")
-        return data
+        text = await gemini_client.generate_async(prompt, timeout)
+        return parse_string_list(text)
+    except asyncio.TimeoutError:
+        print(f"Gemini dish suggestion request timed out for {ingredients}")
+        return None
+    except GeminiConfigError:
+        raise
     except Exception as e:
         print(f"Error parsing Gemini dish suggestion response: {e}\nRaw response: {text}")
         return None
+
+# --- Cached Dish Suggestions ---
+from nutrition_tracker.dish_cache import dish_cache, ingredient_key
+
+# Look up nutrition for suggested dishes in the background, so choosing one is instant.
+DISH_PREFETCH_NUTRITION = os.getenv("DISH_PREFETCH_NUTRITION", "1").strip().lower() not in ("0", "false", "no", "off")
+# Prefetches are best effort and must not crowd out user requests: at most this many run at
+# once (foods beyond that are dropped, not queued) ...
+DISH_PREFETCH_CONCURRENCY = int(os.getenv("DISH_PREFETCH_CONCURRENCY", "2"))
+# ... and none start while the Gemini rate limiter has fewer tokens than this on hand.
+DISH_PREFETCH_MIN_TOKENS = float(os.getenv("DISH_PREFETCH_MIN_TOKENS", "3"))
+dish_flight = SingleFlight()
+_prefetch_tasks: Set[asyncio.Task] = set()
+_prefetch_semaphore = asyncio.Semaphore(DISH_PREFETCH_CONCURRENCY)
+prefetch_stats = {"prefetched": 0, "failed": 0, "skipped_busy": 0, "skipped_low_quota": 0}
+register_stats("prefetch", lambda: dict(prefetch_stats))
+
+async def _prefetch_one(food: str, amount: float) -> None:
+    if _prefetch_semaphore.locked():
+        prefetch_stats["skipped_busy"] += 1
+        return
+    async with _prefetch_semaphore:
+        try:
+            await get_nutrition_cached(food, amount)
+            prefetch_stats["prefetched"] += 1
+        except Exception as e:
+            prefetch_stats["failed"] += 1
+            print(f"Nutrition prefetch failed for {food}: {type(e).__name__}: {e}")
+
+async def _prefetch(foods: List[str], amount: float) -> None:
+    if await gemini_client.rate_limiter.available() < DISH_PREFETCH_MIN_TOKENS:
+        prefetch_stats["skipped_low_quota"] += len(foods)
+        return
+    await asyncio.gather(*(_prefetch_one(f, amount) for f in foods))
+
+def prefetch_nutrition(foods: List[str], amount: float = 1) -> asyncio.Task:
+    """
+    Starts concurrent get_nutrition_cached lookups for the foods without waiting for them.
+    A later lookup of the same food hits the cache, or joins the call still in flight.
+    Foods are skipped when DISH_PREFETCH_CONCURRENCY prefetches are already running or the
+    Gemini quota is below DISH_PREFETCH_MIN_TOKENS.
+    """
+    task = asyncio.create_task(_prefetch(list(foods), amount))
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+    return task
+
+async def _fetch_and_cache_dishes(ingredients: List[str], timeout: Optional[float]) -> Optional[List[str]]:
+    dishes = await suggest_dishes_from_gemini_async(ingredients, timeout)
+    if dishes:
+        dish_cache.set(ingredients, dishes)
+    return dishes
+
+async def suggest_dishes_cached(
+    ingredients: List[str], timeout: Optional[float] = None, prefetch: bool = DISH_PREFETCH_NUTRITION
+) -> Optional[List[str]]:
+    """
+    Dish suggestions for a pantry, answered from the dish cache when the same (or a close
+    enough) ingredient set was seen before; concurrent misses for one pantry share a Gemini
+    call. With `prefetch`, nutrition for one serving of each suggested dish is looked up
+    in the background.
+    """
+    dishes = dish_cache.get(ingredients)
+    if dishes is None:
+        dishes = await dish_flight.do(ingredient_key(ingredients), lambda: _fetch_and_cache_dishes(ingredients, timeout))
+        dishes = list(dishes) if dishes else None
+    if dishes and prefetch:
+        prefetch_nutrition(dishes)
+    return dishes
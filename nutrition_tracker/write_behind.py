@@ -0,0 +1,375 @@
+"""
+Optional write-behind mode for nutrition log inserts.
+
+With LOG_WRITE_BEHIND=1, log_nutrition() puts entries on an in-process queue and
+returns immediately. A background flusher writes them in batches (when
+LOG_FLUSH_MAX_ENTRIES are waiting or LOG_FLUSH_INTERVAL_SECONDS have passed): one
+transaction with a multi-row INSERT into nutrition_log plus one totals upsert per
+user and one daily-rollup upsert per (user, day). Totals and summaries therefore
+lag behind a logged entry by up to one flush interval.
+
+With LOG_JOURNAL_PATH set, each entry is appended to a local journal before it is
+queued, and a commit marker is appended after each flush, so entries that were
+accepted but not yet flushed when the process died are replayed on the next start.
+The journal is fsynced once per batch, in a worker thread, before the batch is
+written (group commit). A process crash loses no accepted entry; a power loss can
+lose up to one flush interval of them.
+
+A batch that still fails after LOG_FLUSH_MAX_RETRIES is split in halves until the
+entries that cannot be written are alone; those are dead-lettered (printed in full
+and counted in stats) and the rest of the batch is committed.
+"""
+import asyncio
+import glob
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+
+from nutrition_tracker.analytics import trend_cache
+from nutrition_tracker.db import AsyncSessionLocal, dialect_insert, env_bool
+from nutrition_tracker.metrics import register_stats
+from nutrition_tracker.models import User, NutritionLog
+from nutrition_tracker.normalize import NUTRIENT_KEYS
+from nutrition_tracker.rollup import add_to_daily_rollup
+from nutrition_tracker.tracker import add_to_totals, log_nutrition_to_db, log_nutrition_batch_to_db
+
+
+LOG_WRITE_BEHIND = env_bool("LOG_WRITE_BEHIND", False)
+LOG_FLUSH_MAX_ENTRIES = int(os.environ.get("LOG_FLUSH_MAX_ENTRIES", 200))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.environ.get("LOG_FLUSH_INTERVAL_SECONDS", 0.5))
+# Producers wait (backpressure) once this many entries are queued.
+LOG_QUEUE_MAX = int(os.environ.get("LOG_QUEUE_MAX", 10000))
+LOG_JOURNAL_PATH = os.environ.get("LOG_JOURNAL_PATH") or None
+# fsync the journal once per batch; off, the OS decides when it reaches the disk.
+LOG_JOURNAL_FSYNC = env_bool("LOG_JOURNAL_FSYNC", True)
+# How long stop() keeps retrying a failing flush before leaving entries to the journal.
+LOG_DRAIN_TIMEOUT_SECONDS = float(os.environ.get("LOG_DRAIN_TIMEOUT_SECONDS", 30))
+# Retries for a failing batch before it is split to find the entries that cannot be written.
+LOG_FLUSH_MAX_RETRIES = int(os.environ.get("LOG_FLUSH_MAX_RETRIES", 5))
+_RETRY_MAX_SECONDS = 5.0
+
+
+class LogJournal:
+    """
+    Append-only NDJSON journal: one line per accepted entry ({"seq": n, ...}) and one
+    line per successful flush ({"committed": n}, covering every seq up to n).
+    """
+
+    def __init__(self, path: str, fsync: bool = LOG_JOURNAL_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self._file = None
+        self._unsynced = False
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        # Flushed to the OS right away (survives a process crash); see sync() for the disk.
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        self._write(entry)
+        self._unsynced = True
+
+    def sync(self) -> None:
+        """fsyncs everything appended so far. Blocking; the flusher runs it in a thread once per batch."""
+        if not self.fsync or not self._unsynced or self._file is None:
+            return
+        self._unsynced = False
+        os.fsync(self._file.fileno())
+
+    def mark_committed(self, seq: int) -> None:
+        self._write({"committed": seq})
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Entries after the last commit marker, in order. A torn last line (crash mid-write) is skipped."""
+        entries, committed = [], 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "committed" in record:
+                        committed = max(committed, record["committed"])
+                    else:
+                        entries.append(record)
+        except FileNotFoundError:
+            return []
+        return [e for e in entries if e["seq"] > committed]
+
+    def truncate(self) -> None:
+        self.close()
+        open(self.path, "w").close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def orphaned_journals(base: str, workers: int) -> List[str]:
+    """
+    Journals under `base` that no running process owns. With `workers` pre-forked workers
+    (journals base.0 .. base.<workers-1>) that is the plain base and any higher-numbered
+    journal; in single-process mode (workers=0) every numbered one.
+    """
+    owned = {f"{base}.{n}" for n in range(workers)} if workers else {base}
+    numbered = [p for p in glob.glob(glob.escape(base) + ".*") if p[len(base) + 1:].isdigit()]
+    return sorted(p for p in [base, *numbered] if p not in owned and os.path.exists(p))
+
+
+class WriteBehindLogger:
+    def __init__(
+        self,
+        max_entries: int = LOG_FLUSH_MAX_ENTRIES,
+        interval: float = LOG_FLUSH_INTERVAL_SECONDS,
+        journal_path: Optional[str] = LOG_JOURNAL_PATH,
+    ):
+        self.max_entries = max_entries
+        self.interval = interval
+        self.journal = LogJournal(journal_path) if journal_path else None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._seq = 0
+        self.stats = {"enqueued": 0, "flushed": 0, "batches": 0, "flush_errors": 0, "replayed": 0,
+                      "dead_lettered": 0, "last_batch_size": 0, "last_flush_ms": 0.0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=LOG_QUEUE_MAX)
+        if self.journal:
+            pending = self.journal.pending()
+            if pending:
+                replayed = await self._replay(pending)
+                print(f"Replayed {replayed} of {len(pending)} journaled nutrition log entries")
+            self.journal.truncate()
+        self._task = asyncio.create_task(self._run())
+
+    async def replay_orphans(self, base: str, workers: int) -> int:
+        """
+        Replays and removes the journals of workers that no longer exist (MCP_WORKERS was
+        lowered or pre-fork mode turned off), so their entries are not stranded. Run it in
+        one process only, before start().
+        """
+        total = 0
+        for path in orphaned_journals(base, workers):
+            pending = LogJournal(path).pending()
+            if pending:
+                replayed = await self._replay(pending)
+                print(f"Replayed {replayed} of {len(pending)} nutrition log entries from orphaned journal {path}")
+                total += replayed
+            os.remove(path)
+        return total
+
+    async def _replay(self, entries: List[Dict[str, Any]]) -> int:
+        """
+        Writes journaled entries that never got a commit marker. An entry whose row already
+        exists (the process died between the DB commit and the marker) is skipped.
+        """
+        fresh = []
+        async with AsyncSessionLocal() as session:
+            for e in entries:
+                exists = (await session.execute(
+                    select(NutritionLog.id).join(User, User.id == NutritionLog.user_id).where(
+                        User.user_id == e["user_id"],
+                        NutritionLog.timestamp == datetime.fromisoformat(e["timestamp"]),
+                        NutritionLog.food == e["food"],
+                        NutritionLog.amount == e["amount"],
+                    ).limit(1)
+                )).first()
+                if exists is None:
+                    fresh.append(e)
+        if fresh and not await self._try_flush(fresh, LOG_FLUSH_MAX_RETRIES):
+            await self._isolate(fresh)
+        self.stats["replayed"] += len(fresh)
+        return len(fresh)
+
+    async def enqueue(
+        self, user_id: str, food: str, amount: float, nutrition: Dict[str, float], timestamp: datetime
+    ) -> Dict[str, Any]:
+        self._seq += 1
+        entry = {
+            "seq": self._seq,
+            "user_id": user_id,
+            "food": food,
+            "amount": float(amount),
+            "nutrition": {k: float(nutrition[k]) for k in NUTRIENT_KEYS},
+            "timestamp": timestamp.isoformat(),
+        }
+        if self.journal:
+            self.journal.append(entry)
+        await self._queue.put(entry)
+        self.stats["enqueued"] += 1
+        return entry
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.max_entries:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            if self.journal:
+                try:
+                    await asyncio.to_thread(self.journal.sync)
+                except OSError as e:
+                    print(f"Error syncing nutrition log journal: {e}")
+            await self._flush_with_retry(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _flush_with_retry(self, batch: List[Dict[str, Any]]) -> None:
+        if not await self._try_flush(batch, LOG_FLUSH_MAX_RETRIES):
+            await self._isolate(batch)
+        if self.journal:
+            self.journal.mark_committed(max(e["seq"] for e in batch))
+            if self._queue.qsize() == 0:
+                self.journal.truncate()
+
+    async def _try_flush(self, batch: List[Dict[str, Any]], retries: int) -> bool:
+        delay = 0.1
+        for attempt in range(retries + 1):
+            try:
+                # Shielded so stop() cannot cancel a transaction half way.
+                await asyncio.shield(self._flush(batch))
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                print(f"Error flushing {len(batch)} nutrition log entries (attempt {attempt + 1}): {e}")
+                if attempt < retries:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, _RETRY_MAX_SECONDS)
+        return False
+
+    async def _isolate(self, batch: List[Dict[str, Any]]) -> None:
+        """Writes a batch that keeps failing half by half, dead-lettering entries that fail on their own."""
+        if len(batch) == 1:
+            self.stats["dead_lettered"] += 1
+            print(f"Dead-lettered nutrition log entry: {json.dumps(batch[0])}")
+            return
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            # The whole batch already went through the retries; one more try per half.
+            if not await self._try_flush(half, 1):
+                await self._isolate(half)
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        started = asyncio.get_running_loop().time()
+        user_ids = sorted({e["user_id"] for e in batch})
+        totals: Dict[str, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(NUTRIENT_KEYS, 0.0))
+        daily: Dict[Tuple[str, Any], Dict[str, float]] = defaultdict(lambda: dict.fromkeys(NUTRIENT_KEYS, 0.0))
+        daily_entries: Dict[Tuple[str, Any], int] = defaultdict(int)
+        rows = []
+        for e in batch:
+            timestamp = datetime.fromisoformat(e["timestamp"])
+            rows.append((e, timestamp))
+            for k in NUTRIENT_KEYS:
+                totals[e["user_id"]][k] += e["nutrition"][k]
+                daily[(e["user_id"], timestamp.date())][k] += e["nutrition"][k]
+            daily_entries[(e["user_id"], timestamp.date())] += 1
+
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                dialect_insert(User).values([{"user_id": u} for u in user_ids])
+                .on_conflict_do_nothing(index_elements=["user_id"])
+            )
+            pks = dict((await session.execute(
+                select(User.user_id, User.id).where(User.user_id.in_(user_ids))
+            )).all())
+            # Multi-row INSERT (executemany is sent as batched VALUES lists).
+            await session.execute(insert(NutritionLog), [
+                {"user_id": pks[e["user_id"]], "food": e["food"], "amount": e["amount"], "timestamp": ts, **e["nutrition"]}
+                for e, ts in rows
+            ])
+            for user_id in user_ids:
+                await add_to_totals(session, pks[user_id], totals[user_id])
+            for (user_id, day), nutrition in daily.items():
+                await add_to_daily_rollup(session, pks[user_id], day, nutrition, entries=daily_entries[(user_id, day)])
+            await session.commit()
+
+        for user_id in user_ids:
+            trend_cache.invalidate(user_id)
+        self.stats["flushed"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["last_batch_size"] = len(batch)
+        self.stats["last_flush_ms"] = round((asyncio.get_running_loop().time() - started) * 1000, 2)
+
+    async def stop(self, timeout: float = LOG_DRAIN_TIMEOUT_SECONDS) -> None:
+        """Flushes everything still queued, then stops the flusher. Call on shutdown."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            where = "kept in the journal" if self.journal else "lost"
+            print(f"Write-behind drain timed out; {self._queue.qsize()} nutrition log entries {where}")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self.journal:
+            self.journal.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.running,
+            "pending": self._queue.qsize() if self._queue else 0,
+            "journal": self.journal.path if self.journal else None,
+        }
+
+
+write_behind = WriteBehindLogger()
+register_stats("write_behind", write_behind.get_stats)
+
+
+async def log_nutrition(
+    user_id: str, food: str, amount: float, nutrition: Dict[str, float], timestamp: Optional[datetime] = None
+) -> None:
+    """
+    Logs one entry: queued for the next batch when write-behind is running,
+    otherwise written immediately with log_nutrition_to_db.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    if write_behind.running:
+        await write_behind.enqueue(user_id, food, amount, nutrition, timestamp)
+    else:
+        await log_nutrition_to_db(user_id, food, amount, nutrition, timestamp=timestamp)
+
+
+async def log_nutrition_batch(
+    user_id: str, entries: List[Tuple[str, float, Dict[str, float]]], timestamp: Optional[datetime] = None
+) -> None:
+    """
+    Logs several (food, amount, nutrition) entries for one user: queued when write-behind
+    is running (the flusher batches them with everything else), otherwise written in one
+    transaction with log_nutrition_batch_to_db.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    if write_behind.running:
+        for food, amount, nutrition in entries:
+            await write_behind.enqueue(user_id, food, amount, nutrition, timestamp)
+    else:
+        await log_nutrition_batch_to_db(user_id, entries, timestamp=timestamp)
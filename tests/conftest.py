@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+
+from nutrition_tracker import db
+from nutrition_tracker.models import Base
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Points the app at an empty SQLite database for one test; returns its path."""
+    path = str(tmp_path / "test.sqlite3")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    saved_url, saved_engine = db.DATABASE_URL, db._engine
+    db.DATABASE_URL, db._engine = f"sqlite+aiosqlite:///{path}", None
+    yield path
+    db.DATABASE_URL, db._engine = saved_url, saved_engine
+
+
+@pytest.fixture
+def run(database):
+    """Runs a coroutine against the test database on a fresh event loop, then disposes the engine."""
+    def runner(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                if db._engine is not None:
+                    await db._engine.dispose()
+                    db._engine = None
+        return asyncio.run(main())
+    return runner
@@ -0,0 +1,56 @@
+import os
+
+from sqlalchemy import select
+
+from nutrition_tracker.bill_cache import BillCache
+from nutrition_tracker.db import AsyncSessionLocal
+from nutrition_tracker.models import ScannedBill
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def bill_image() -> bytes:
+    with open(os.path.join(ROOT, "grocey.jpg"), "rb") as f:
+        return f.read()
+
+
+def test_similar_photo_is_not_matched_by_default(run):
+    image = bill_image()
+
+    async def scenario():
+        cache = BillCache()
+        _, key = await cache.get("user-1", image)
+        await cache.put("user-1", image, ["milk"], key)
+        similar = image + b"\0"
+        return await BillCache().get("user-1", similar), await BillCache(max_distance=4).get("user-1", similar)
+
+    (default_items, _), (opt_in_items, _) = run(scenario())
+    assert default_items is None
+    assert opt_in_items is None  # the first put hashed nothing, so there is nothing to compare against
+
+
+def test_near_duplicate_match_when_enabled(run):
+    image = bill_image()
+
+    async def scenario():
+        cache = BillCache(max_distance=4)
+        _, key = await cache.get("user-1", image)
+        await cache.put("user-1", image, ["milk"], key)
+        return await BillCache(max_distance=4).get("user-1", image + b"\0")
+
+    items, (_, phash) = run(scenario())
+    assert items == ["milk"]
+    assert len(phash) == 64
+
+
+def test_rescan_by_another_user_keeps_the_first_owner(run):
+    image = bill_image()
+
+    async def scenario():
+        await BillCache().put("user-1", image, ["milk"])
+        await BillCache().put("user-2", image, ["milk", "eggs"])
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(select(ScannedBill))).scalars().all()
+
+    rows = run(scenario())
+    assert [r.user_id for r in rows] == ["user-1"]
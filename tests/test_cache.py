@@ -0,0 +1,46 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from nutrition_tracker import tracker
+from nutrition_tracker.cache import NutritionCache
+from nutrition_tracker.db import AsyncSessionLocal
+from nutrition_tracker.models import NutritionCacheEntry
+
+TTL = 3600
+
+
+def test_db_hit_keeps_the_rows_remaining_ttl_in_memory(run):
+    cache = NutritionCache(ttl=TTL)
+
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            session.add(NutritionCacheEntry(
+                food="dal", unit="unit", amount=1.0, calories=100.0, protein=5.0, carbs=10.0, fat=3.0,
+                created_at=datetime.utcnow() - timedelta(seconds=TTL - 60),
+            ))
+            await session.commit()
+        await cache.get("dal", 1)
+        await cache.get("dal", 2)
+
+    run(scenario())
+    assert cache.stats["db_hits"] == 1 and cache.stats["scaled_hits"] == 1
+    for tier, key in ((cache._exact, ("dal", 1.0, "unit")), (cache._profiles, ("dal", "unit")),
+                      (cache._exact, ("dal", 2.0, "unit"))):
+        assert 0 < tier.ttl_left(key) <= 60
+
+
+def test_batch_cache_lookups_run_concurrently(monkeypatch):
+    running, peak = 0, 0
+
+    async def lookup_cached_nutrition(food, amount):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return {"calories": 1.0, "protein": 1.0, "carbs": 1.0, "fat": 1.0}
+
+    monkeypatch.setattr(tracker, "lookup_cached_nutrition", lookup_cached_nutrition)
+    results = asyncio.run(tracker.get_nutrition_batch([("zz food a", 1), ("zz food b", 1), ("zz food c", 1)]))
+    assert all(results)
+    assert peak == 3
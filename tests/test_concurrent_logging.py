@@ -0,0 +1,81 @@
+"""
+Concurrent lock_dish / log_nutrition calls against a temporary SQLite database, with and
+without write-behind: totals and the daily rollup must equal the sum of the logged entries.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from sqlalchemy import func, select
+
+from nutrition_tracker import write_behind as wb
+from nutrition_tracker.db import AsyncSessionLocal
+from nutrition_tracker.models import User, NutritionLog, NutritionTotals, NutritionDaily
+from nutrition_tracker.normalize import NUTRIENT_KEYS
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+USERS = 3
+CALLS = 60
+
+
+def lock_dish_tool():
+    pytest.importorskip("fastmcp")
+    os.environ.setdefault("AUTH_TOKEN", "test-token")
+    os.environ.setdefault("MY_NUMBER", "0")
+    sys.path.insert(0, os.path.join(ROOT, "mcp-bearer-token"))
+    import mcp_starter
+    return lambda user_id, food, nutrition: mcp_starter.lock_dish.fn(user_id=user_id, dish=food, nutrition=nutrition)
+
+
+def log_nutrition_call():
+    return lambda user_id, food, nutrition: wb.log_nutrition(user_id, food, 1, nutrition)
+
+
+def nutrition_for(i):
+    return {"calories": 10.0 + i, "protein": 1.0 + i % 7, "carbs": 2.0 + i % 5, "fat": 0.5 * (i % 3)}
+
+
+async def per_user(model, column):
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(User.user_id, func.sum(column)).join(model, model.user_id == User.id).group_by(User.user_id)
+        )).all()
+    return {u: round(v, 6) for u, v in rows}
+
+
+@pytest.mark.parametrize("write_behind", [False, True], ids=["direct", "write-behind"])
+@pytest.mark.parametrize("entrypoint", [log_nutrition_call, lock_dish_tool], ids=["log_nutrition", "lock_dish"])
+def test_concurrent_logs_add_up(run, monkeypatch, entrypoint, write_behind):
+    call = entrypoint()
+    logger = wb.WriteBehindLogger(max_entries=16, interval=0.01, journal_path=None)
+    monkeypatch.setattr(wb, "write_behind", logger)
+    user_ids = [f"user-{u}" for u in range(USERS)]
+    expected = {u: dict.fromkeys(NUTRIENT_KEYS, 0.0) for u in user_ids}
+    for i in range(CALLS):
+        for k, v in nutrition_for(i).items():
+            expected[user_ids[i % USERS]][k] += v
+
+    async def scenario():
+        if write_behind:
+            await logger.start()
+        await asyncio.gather(*(call(user_ids[i % USERS], f"dish-{i}", nutrition_for(i)) for i in range(CALLS)))
+        if write_behind:
+            await logger.stop()
+        sums = {}
+        for k in NUTRIENT_KEYS:
+            sums[("log", k)] = await per_user(NutritionLog, getattr(NutritionLog, k))
+            sums[("totals", k)] = await per_user(NutritionTotals, getattr(NutritionTotals, k))
+            sums[("daily", k)] = await per_user(NutritionDaily, getattr(NutritionDaily, k))
+        sums[("daily", "entries")] = await per_user(NutritionDaily, NutritionDaily.entries)
+        return sums
+
+    sums = run(scenario())
+    if write_behind:
+        assert logger.stats["flushed"] == CALLS
+    for k in NUTRIENT_KEYS:
+        want = {u: round(v[k], 6) for u, v in expected.items()}
+        assert sums[("log", k)] == want
+        assert sums[("totals", k)] == want
+        assert sums[("daily", k)] == want
+    assert sums[("daily", "entries")] == {u: CALLS // USERS for u in user_ids}
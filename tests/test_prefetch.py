@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from nutrition_tracker import tracker
+from nutrition_tracker.gemini import TokenBucket
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Records prefetched foods; each lookup holds its prefetch slot for a moment."""
+    seen = []
+
+    async def get_nutrition_cached(food, amount):
+        seen.append(food)
+        await asyncio.sleep(0.01)
+        return {"calories": 100.0, "protein": 1.0, "carbs": 1.0, "fat": 1.0}
+
+    monkeypatch.setattr(tracker, "get_nutrition_cached", get_nutrition_cached)
+    monkeypatch.setattr(tracker, "_prefetch_semaphore", asyncio.Semaphore(2))
+    monkeypatch.setattr(tracker, "prefetch_stats", dict.fromkeys(tracker.prefetch_stats, 0))
+    monkeypatch.setattr(tracker.gemini_client, "rate_limiter", TokenBucket(per_minute=60, burst=10))
+    return seen
+
+
+def prefetch(foods):
+    async def main():
+        await tracker.prefetch_nutrition(foods)
+    asyncio.run(main())
+
+
+def test_prefetch_is_capped_and_does_not_queue(lookups):
+    prefetch(["dal", "rice", "roti", "curd", "paneer"])
+    assert lookups == ["dal", "rice"]
+    assert tracker.prefetch_stats["skipped_busy"] == 3
+
+
+def test_prefetch_is_skipped_when_quota_is_low(lookups):
+    bucket = tracker.gemini_client.rate_limiter
+    for _ in range(8):
+        bucket._reserve()
+    prefetch(["dal", "rice"])
+    assert lookups == []
+    assert tracker.prefetch_stats["skipped_low_quota"] == 2
@@ -0,0 +1,180 @@
+"""
+Query plan regression test.
+
+Seeds a throwaway SQLite database, runs the code paths that read or update the
+database (tracker, history, analytics, rollup, caches, shared state, write-behind
+and the nutrition_board tool), records every statement they send, and fails if
+EXPLAIN QUERY PLAN shows a full table scan for any of them.
+"""
+import asyncio
+import importlib.util
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, insert, text
+
+from nutrition_tracker import analytics, db, history, rollup, shared_state, tracker
+from nutrition_tracker.bill_cache import BillCache
+from nutrition_tracker.cache import NutritionCache
+from nutrition_tracker.write_behind import WriteBehindLogger
+from nutrition_tracker.models import Base, User, NutritionLog, NutritionTotals, NutritionDaily, NutritionCacheEntry
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+USERS = 100
+LOGS_PER_USER = 200
+FOODS = ["egg", "roti", "dal", "rice", "curd", "apple", "banana", "paneer", "chicken breast", "oat"]
+NUTRITION = {"calories": 100.0, "protein": 5.0, "carbs": 10.0, "fat": 3.0}
+
+
+def seed(path: str) -> None:
+    rng = random.Random(0)
+    base = datetime(2025, 1, 1)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": u, "user_id": f"user-{u}"} for u in range(1, USERS + 1)])
+        conn.execute(insert(NutritionTotals), [
+            {"user_id": u, "calories": 0.0, "protein": 0.0, "carbs": 0.0, "fat": 0.0} for u in range(1, USERS + 1)
+        ])
+        logs, daily = [], {}
+        for u in range(1, USERS + 1):
+            for _ in range(LOGS_PER_USER):
+                ts = base + timedelta(minutes=rng.randrange(0, 600 * 24 * 60))
+                kcal = rng.uniform(50, 600)
+                logs.append({
+                    "user_id": u, "food": rng.choice(FOODS), "amount": 1.0, "timestamp": ts,
+                    "calories": kcal, "protein": kcal / 20, "carbs": kcal / 8, "fat": kcal / 30,
+                })
+                daily[(u, ts.date())] = daily.get((u, ts.date()), 0.0) + kcal
+        conn.execute(insert(NutritionLog), logs)
+        conn.execute(insert(NutritionDaily), [
+            {"user_id": u, "day": d, "calories": kcal, "protein": 0.0, "carbs": 0.0, "fat": 0.0, "entries": 1}
+            for (u, d), kcal in daily.items()
+        ])
+        conn.execute(insert(NutritionCacheEntry), [
+            {"food": f, "unit": "unit", "amount": float(a), "calories": 1.0, "protein": 1.0, "carbs": 1.0, "fat": 1.0}
+            for f in FOODS for a in range(1, 20)
+        ])
+        conn.execute(text("ANALYZE"))
+    engine.dispose()
+
+
+def nutrition_board():
+    if importlib.util.find_spec("fastmcp") is None:
+        return None
+    os.environ.setdefault("AUTH_TOKEN", "test-token")
+    os.environ.setdefault("MY_NUMBER", "0")
+    sys.path.insert(0, os.path.join(ROOT, "mcp-bearer-token"))
+    import mcp_starter
+    return mcp_starter.nutrition_board.fn(user_id="user-7")
+
+
+async def rate_limit():
+    bucket = shared_state.SharedTokenBucket("test", 60, 5)
+    await bucket.reserve()
+    await bucket.reserve()
+    await bucket.available()
+
+
+async def write_behind_flush():
+    entry = {"user_id": "user-7", "food": "egg", "amount": 1.0, "nutrition": NUTRITION,
+             "timestamp": datetime(2026, 1, 15, 8).isoformat()}
+    await WriteBehindLogger(journal_path=None)._flush([entry, {**entry, "user_id": "user-8"}])
+
+
+async def bill_cache_paths():
+    with open(os.path.join(ROOT, "grocey.jpg"), "rb") as f:
+        image = f.read()
+    cache = BillCache()
+    items, key = await cache.get("user-7", image)
+    await cache.put("user-7", image, ["milk", "eggs"], key)
+    await BillCache().get("user-7", image)
+    await BillCache(max_distance=4).get("user-7", image + b"\0")
+    await cache.purge_expired()
+
+
+async def nutrition_cache_paths():
+    cache = NutritionCache()
+    await cache.get("egg", 3)
+    await cache.get("egg", 25)
+    await cache.put("dal", 2, NUTRITION)
+    await cache.purge_expired()
+
+
+SCENARIOS = {
+    "log_nutrition_to_db": lambda: tracker.log_nutrition_to_db("user-7", "egg", 2, NUTRITION),
+    "log_nutrition_batch_to_db": lambda: tracker.log_nutrition_batch_to_db(
+        "user-7", [("egg", 2, NUTRITION), ("roti", 1, NUTRITION)]
+    ),
+    "get_nutrition_totals_from_db": lambda: tracker.get_nutrition_totals_from_db("user-7", "2025-03-01", "2025-03-31"),
+    "nutrition_board": nutrition_board,
+    "fetch_history_page": lambda: history.fetch_history_page(
+        "user-7", history.encode_cursor(datetime(2025, 3, 1), 1000), 50, "2025-01-01", "2025-12-31"
+    ),
+    "get_nutrition_trends": lambda: analytics.get_nutrition_trends("user-7", "2025-01-01", "2025-06-30"),
+    "rebuild_daily_rollup": lambda: rollup.rebuild_daily_rollup("user-9"),
+    "check_daily_rollup": lambda: rollup.check_daily_rollup("user-9"),
+    "data_version": lambda: shared_state.data_version("user-7"),
+    "SharedTokenBucket.reserve": rate_limit,
+    "write-behind flush": write_behind_flush,
+    "NutritionCache": nutrition_cache_paths,
+    "BillCache": bill_cache_paths,
+}
+
+
+@pytest.fixture(scope="module")
+def executed(tmp_path_factory):
+    """Runs every scenario once against the seeded database; returns (path, {name: [(sql, params)]})."""
+    path = str(tmp_path_factory.mktemp("plans") / "plans.sqlite3")
+    seed(path)
+    saved_url, saved_engine = db.DATABASE_URL, db._engine
+    db.DATABASE_URL, db._engine = f"sqlite+aiosqlite:///{path}", None
+    statements = {}
+    current = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            current.append((statement, parameters))
+
+    async def run_all():
+        event.listen(db.get_engine().sync_engine, "before_cursor_execute", capture)
+        for name, factory in SCENARIOS.items():
+            current.clear()
+            result = factory()
+            if asyncio.iscoroutine(result):
+                await result
+            statements[name] = list(current)
+        await db.get_engine().dispose()
+
+    try:
+        asyncio.run(run_all())
+    finally:
+        db.DATABASE_URL, db._engine = saved_url, saved_engine
+    return path, statements
+
+
+def full_scans(path, statements):
+    """Plan lines that read a whole table; "SCAN t USING ... INDEX" walks an index instead."""
+    tables = set(Base.metadata.tables)
+    failures = []
+    with sqlite3.connect(path) as conn:
+        for sql, params in statements:
+            for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+                detail = row[-1]
+                words = detail.split()
+                if words[0] == "SCAN" and words[1] in tables and "INDEX" not in detail:
+                    failures.append(f"{detail}: {' '.join(sql.split())}")
+    return failures
+
+
+@pytest.mark.parametrize("name", list(SCENARIOS))
+def test_no_full_table_scans(executed, name):
+    if name == "nutrition_board":
+        pytest.importorskip("fastmcp")
+    path, statements = executed
+    assert statements[name], f"{name} sent no statements"
+    assert full_scans(path, statements[name]) == []
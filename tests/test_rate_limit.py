@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from nutrition_tracker.db import AsyncSessionLocal
+from nutrition_tracker.gemini import RateLimitExceeded, TokenBucket
+from nutrition_tracker.models import RateLimitBucket
+from nutrition_tracker.shared_state import SharedTokenBucket
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def timed_out_burst(bucket, callers=30, max_wait=2.0, timeout=0.05):
+    """Fires `callers` requests that give up after `timeout`; returns how many failed fast."""
+    async def call():
+        try:
+            await asyncio.wait_for(bucket.acquire(max_wait), timeout)
+            return "served"
+        except RateLimitExceeded:
+            return "refused"
+        except asyncio.TimeoutError:
+            return "timed out"
+
+    outcomes = await asyncio.gather(*(call() for _ in range(callers)))
+    return {o: outcomes.count(o) for o in set(outcomes)}
+
+
+def test_bucket_recovers_after_timed_out_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=60, burst=5, clock=clock)
+
+    outcomes = asyncio.run(timed_out_burst(bucket))
+
+    # 5 tokens on hand, 2 more reservable within max_wait=2s at 1 token/s, the rest refused up front.
+    assert outcomes == {"served": 5, "timed out": 2, "refused": 23}
+    # The two timed-out waiters gave their tokens back, so no debt is left behind.
+    assert bucket._tokens == 0
+    clock.now += 1
+    assert asyncio.run(bucket.acquire(max_wait=0)) == 0
+
+
+def test_deadline_shorter_than_wait_is_refused_without_reserving():
+    bucket = TokenBucket(per_minute=60, burst=1, clock=FakeClock())
+    assert bucket._reserve(max_wait=0) == 0
+    assert bucket._reserve(max_wait=0.5) is None
+    assert bucket._tokens == 0
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(bucket.acquire(max_wait=0.5))
+
+
+def test_shared_bucket_recovers_after_timed_out_burst(run):
+    clock = FakeClock()
+    shared = SharedTokenBucket("test", 60, 5, clock=clock)
+    bucket = TokenBucket(per_minute=60, burst=5, shared=shared, clock=clock)
+
+    async def scenario():
+        outcomes = await timed_out_burst(bucket, callers=10, timeout=0.5)
+        async with AsyncSessionLocal() as session:
+            tokens = (await session.get(RateLimitBucket, "test")).tokens
+        clock.now += 1
+        return outcomes, tokens, await shared.reserve(max_wait=0)
+
+    outcomes, tokens, wait = run(scenario())
+    assert outcomes["timed out"] > 0
+    # Only served callers keep their token; timed-out ones refunded theirs, refused ones took none.
+    assert tokens == 5 - outcomes.get("served", 0)
+    assert wait == 0
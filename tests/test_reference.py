@@ -0,0 +1,60 @@
+import pytest
+
+from nutrition_tracker import tracker
+from nutrition_tracker.cache import NutritionCache
+from nutrition_tracker.reference import ReferenceIndex, load_reference_index
+
+
+def test_large_bare_amount_of_countable_food_is_left_to_gemini():
+    index = load_reference_index()
+    # "100 roti" could be 100 g or 100 pieces; the index must not guess 100 pieces.
+    assert index.lookup("roti", 100) is None
+    assert index.lookup("eggs", 12) is None
+    assert index.stats["ambiguous"] == 2
+
+
+def test_small_bare_amount_of_countable_food_is_pieces():
+    result = load_reference_index().lookup("roti", 2)
+    assert result["nutrition"]["calories"] == 220
+
+
+def test_large_bare_amount_of_weighed_food_is_grams():
+    result = load_reference_index().lookup("rice", 100)
+    assert result["nutrition"]["calories"] == 130
+
+
+@pytest.fixture
+def tracker_with_gemini(monkeypatch):
+    """tracker with a fresh reference index and nutrition cache; Gemini answers 300 kcal per prompt."""
+    prompts = []
+
+    async def generate_async(prompt, timeout=None, model_name=None):
+        prompts.append(prompt)
+        return '{"calories": 300, "protein": 6, "carbs": 40, "fat": 12}'
+
+    monkeypatch.setattr(tracker, "reference_index", ReferenceIndex())
+    monkeypatch.setattr(tracker, "nutrition_cache", NutritionCache())
+    monkeypatch.setattr(tracker.gemini_client, "generate_async", generate_async)
+    return prompts
+
+
+def test_food_asked_for_repeatedly_is_promoted(run, tracker_with_gemini):
+    async def scenario():
+        return [await tracker.get_nutrition_cached("paratha", amount) for amount in (1, 2, 3, 4)]
+
+    results = run(scenario())
+    # One Gemini answer, then two cache hits reach REFERENCE_PROMOTE_AFTER; the fourth is local.
+    assert len(tracker_with_gemini) == 1
+    assert [r["calories"] for r in results] == [300, 600, 900, 1200]
+    assert tracker.reference_index.stats["promoted"] == 1
+    assert tracker.reference_index.lookup("paratha", 1)["nutrition"]["calories"] == 300
+
+
+def test_large_bare_amount_answer_is_not_learned_per_piece(run, tracker_with_gemini):
+    async def scenario():
+        for _ in range(5):
+            await tracker.get_nutrition_cached("paratha", 100)
+
+    run(scenario())
+    assert tracker.reference_index.stats["promoted"] == 0
+    assert tracker.reference_index.lookup("paratha", 1) is None
@@ -0,0 +1,200 @@
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from nutrition_tracker import write_behind as wb
+from nutrition_tracker.db import AsyncSessionLocal
+from nutrition_tracker.models import NutritionLog, NutritionTotals
+from nutrition_tracker.write_behind import LogJournal, WriteBehindLogger
+
+NUTRITION = {"calories": 100.0, "protein": 5.0, "carbs": 10.0, "fat": 3.0}
+
+
+def entries(count, start=1, user_id="user-1"):
+    base = datetime(2026, 1, 15, 8)
+    return [
+        {"seq": seq, "user_id": user_id, "food": f"food-{seq}", "amount": 1.0, "nutrition": dict(NUTRITION),
+         "timestamp": (base + timedelta(minutes=seq)).isoformat()}
+        for seq in range(start, start + count)
+    ]
+
+
+async def logged():
+    """(log rows per food, total calories) in the database."""
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(NutritionLog.food, func.count()).group_by(NutritionLog.food)
+        )).all()
+        calories = (await session.execute(select(func.coalesce(func.sum(NutritionTotals.calories), 0)))).scalar_one()
+    return dict(rows), calories
+
+
+async def restart(path):
+    """Starts a fresh logger on the journal (replaying it) and stops it again."""
+    logger = WriteBehindLogger(journal_path=path)
+    await logger.start()
+    await logger.stop()
+    return logger
+
+
+def test_crash_before_db_commit_replays_every_entry(run, tmp_path):
+    path = str(tmp_path / "journal")
+    journal = LogJournal(path)
+    for e in entries(3):
+        journal.append(e)
+    journal.close()
+
+    async def scenario():
+        logger = await restart(path)
+        return logger.stats["replayed"], await logged()
+
+    replayed, (rows, calories) = run(scenario())
+    assert replayed == 3
+    assert rows == {"food-1": 1, "food-2": 1, "food-3": 1}
+    assert calories == 300
+    # Replay is followed by a truncate, so a second restart replays nothing.
+    assert LogJournal(path).pending() == []
+    assert os.path.getsize(path) == 0
+
+
+def test_crash_between_db_commit_and_marker_is_not_written_twice(run, tmp_path):
+    path = str(tmp_path / "journal")
+    journal = LogJournal(path)
+    batch = entries(3)
+    for e in batch:
+        journal.append(e)
+    journal.close()
+
+    async def scenario():
+        # The batch reached the database, but the process died before mark_committed.
+        await WriteBehindLogger(journal_path=None)._flush(batch)
+        logger = await restart(path)
+        return logger.stats["replayed"], await logged()
+
+    replayed, (rows, calories) = run(scenario())
+    assert replayed == 0
+    assert rows == {"food-1": 1, "food-2": 1, "food-3": 1}
+    assert calories == 300
+
+
+def test_only_entries_after_the_last_marker_are_replayed(run, tmp_path):
+    path = str(tmp_path / "journal")
+    journal = LogJournal(path)
+    first, second = entries(2), entries(2, start=3)
+    for e in first:
+        journal.append(e)
+    journal.mark_committed(2)
+    for e in second:
+        journal.append(e)
+    journal.close()
+    # A crash mid-write leaves a torn last line, which is skipped.
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 5, "user_')
+
+    async def scenario():
+        await WriteBehindLogger(journal_path=None)._flush(first)
+        logger = await restart(path)
+        return logger.stats["replayed"], await logged()
+
+    replayed, (rows, _) = run(scenario())
+    assert replayed == 2
+    assert rows == {"food-1": 1, "food-2": 1, "food-3": 1, "food-4": 1}
+
+
+def test_journal_is_truncated_once_the_queue_drains(run, tmp_path):
+    path = str(tmp_path / "journal")
+
+    async def scenario():
+        logger = WriteBehindLogger(interval=0.01, journal_path=path)
+        await logger.start()
+        for e in entries(3):
+            await logger.enqueue(e["user_id"], e["food"], e["amount"], e["nutrition"],
+                                 datetime.fromisoformat(e["timestamp"]))
+        await logger._queue.join()
+        size = os.path.getsize(path)
+        await logger.stop()
+        return size, await logged()
+
+    size, (_, calories) = run(scenario())
+    assert size == 0
+    assert calories == 300
+
+
+def test_entry_that_cannot_be_written_is_dead_lettered(run, tmp_path, monkeypatch):
+    monkeypatch.setattr(wb, "LOG_FLUSH_MAX_RETRIES", 0)
+    path = str(tmp_path / "journal")
+    batch = entries(4)
+    batch[2]["food"] = None  # violates nutrition_log.food NOT NULL
+
+    async def scenario():
+        logger = WriteBehindLogger(journal_path=path)
+        for e in batch:
+            logger.journal.append(e)
+        await logger.start()
+        await logger.stop()
+        return logger.stats, await logged()
+
+    stats, (rows, calories) = run(scenario())
+    assert stats["dead_lettered"] == 1
+    assert rows == {"food-1": 1, "food-2": 1, "food-4": 1}
+    assert calories == 300
+
+
+def test_orphaned_worker_journals_are_replayed_after_scaling_down(run, tmp_path):
+    base = str(tmp_path / "journal")
+    # Journaled under MCP_WORKERS=2, never flushed.
+    for worker, batch in enumerate((entries(2), entries(2, start=3))):
+        journal = LogJournal(f"{base}.{worker}")
+        for e in batch:
+            journal.append(e)
+        journal.close()
+
+    async def scenario():
+        # Restarted with MCP_WORKERS=1: worker 0 owns base.0 and picks up base.1.
+        logger = WriteBehindLogger(journal_path=f"{base}.0")
+        orphans = await logger.replay_orphans(base, 1)
+        await logger.start()
+        await logger.stop()
+        return orphans, logger.stats["replayed"], await logged()
+
+    orphans, replayed, (rows, calories) = run(scenario())
+    assert orphans == 2
+    assert replayed == 4
+    assert rows == {"food-1": 1, "food-2": 1, "food-3": 1, "food-4": 1}
+    assert calories == 400
+    assert not os.path.exists(f"{base}.1")
+
+
+def test_single_process_replays_every_worker_journal(run, tmp_path):
+    base = str(tmp_path / "journal")
+    for worker in range(2):
+        journal = LogJournal(f"{base}.{worker}")
+        journal.append(entries(1, start=worker + 1)[0])
+        journal.close()
+
+    async def scenario():
+        logger = WriteBehindLogger(journal_path=base)
+        orphans = await logger.replay_orphans(base, 0)
+        return orphans, await logged()
+
+    orphans, (rows, _) = run(scenario())
+    assert orphans == 2
+    assert rows == {"food-1": 1, "food-2": 1}
+    assert not os.path.exists(f"{base}.0") and not os.path.exists(f"{base}.1")
+
+
+def test_batch_log_goes_through_the_queue_when_running(run, monkeypatch):
+    logger = WriteBehindLogger(interval=0.01, journal_path=None)
+    monkeypatch.setattr(wb, "write_behind", logger)
+
+    async def scenario():
+        await logger.start()
+        await wb.log_nutrition_batch("user-1", [("dal", 1.0, NUTRITION), ("rice", 2.0, NUTRITION)])
+        await logger.stop()
+        return await logged()
+
+    rows, calories = run(scenario())
+    assert logger.stats["enqueued"] == 2
+    assert rows == {"dal": 1, "rice": 1}
+    assert calories == 200